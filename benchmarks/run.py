@@ -0,0 +1,149 @@
+"""
+Microbenchmarks for the hot paths in weather_clients, run entirely offline
+against the recorded payloads:
+
+    python -m benchmarks.run [--filter haversine] [--output results.json]
+
+Each benchmark is timed with timeit, best of --repeat runs, and the results
+are written as JSON (to benchmarks/results/<commit>.json by default) so two
+commits can be compared with --compare.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import timeit
+from datetime import datetime, timezone
+
+from weather_clients.factory import Factory
+from weather_clients.serialization import SERIALIZERS
+from weather_clients.weather_apis.base import WeatherDataClient
+from weather_clients.weather_apis.utils.definitions import (open_weather_visibility_lookup,
+                                                            open_weather_wind_direction_lookup)
+from weather_clients.weather_apis.utils.spatial import SpatialIndex
+
+from .payloads import CLIENT_PAYLOADS, load_body, load_payload, make_sitelist, process_args
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def client_benchmarks(factory):
+    benchmarks = {}
+    for client_name, payload_name in CLIENT_PAYLOADS.items():
+        client = factory.get_member(client_name)
+        body = load_body(payload_name)
+        args = process_args(client_name, json.loads(body))
+        benchmarks[f"process_data.{client_name}"] = lambda client=client, args=args: client.process_data(*args)
+        benchmarks[f"decode_and_process.{client_name}"] = (
+            lambda client=client, body=body: client.process_data(*process_args(type(client).__name__, json.loads(body))))
+    return benchmarks
+
+
+def location_benchmarks(factory):
+    met_office = factory.get_member('MetOfficeClient')
+    met_office.locations = make_sitelist()['Locations']['Location']
+    met_office.location_index = SpatialIndex(met_office.locations)
+    rng = random.Random(1)
+    queries = [(rng.uniform(50, 58), rng.uniform(-5, 1)) for _ in range(100)]
+    return {
+        'met_office.build_index': lambda: SpatialIndex(met_office.locations),
+        'met_office.get_closest_location_x100': lambda: [met_office.get_closest_location(lat, lon) for lat, lon in queries],
+        'haversine_x100': lambda: [WeatherDataClient.haversine(lat, lon, 50.73862, -2.90325) for lat, lon in queries],
+    }
+
+
+def lookup_benchmarks():
+    rng = random.Random(2)
+    visibilities = [rng.uniform(0, 60000) for _ in range(1000)]
+    directions = [rng.uniform(0, 360) for _ in range(1000)]
+    return {
+        'visibility_lookup_x1000': lambda: [open_weather_visibility_lookup(value) for value in visibilities],
+        'wind_direction_lookup_x1000': lambda: [open_weather_wind_direction_lookup(value) for value in directions],
+    }
+
+
+def serialization_benchmarks(factory):
+    """Encodes a /get_weather response with every provider, cold and with the per series bytes cached"""
+    response = {}
+    for client_name, payload_name in CLIENT_PAYLOADS.items():
+        client = factory.get_member(client_name)
+        response[client_name] = client.process_data(*process_args(client_name, load_payload(payload_name)))
+    all_series = [series for forecast in response.values()
+                  for series in (forecast.values() if isinstance(forecast, dict) else [forecast])]
+
+    def cold(serializer):
+        for series in all_series:
+            series.encoded.clear()
+        return serializer.encode(response)
+
+    benchmarks = {}
+    for name, serializer in SERIALIZERS.items():
+        benchmarks[f"serialize.{name}.cold"] = lambda serializer=serializer: cold(serializer)
+        benchmarks[f"serialize.{name}.cached"] = lambda serializer=serializer: serializer.encode(response)
+    return benchmarks
+
+
+def all_benchmarks():
+    factory = Factory()
+    return {**client_benchmarks(factory), **location_benchmarks(factory),
+            **lookup_benchmarks(), **serialization_benchmarks(factory)}
+
+
+def time_benchmark(function, repeat):
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    timings = sorted(total / number for total in timer.repeat(repeat=repeat, number=number))
+    return {'best_s': timings[0], 'median_s': timings[len(timings) // 2], 'loops': number, 'repeat': repeat}
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous_path, results):
+    with open(previous_path) as f:
+        previous = json.load(f)['benchmarks']
+    for name, result in results.items():
+        if name in previous:
+            change = result['best_s'] / previous[name]['best_s'] - 1
+            print(f"{name:55} {change:+8.1%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filter', help="only run benchmarks whose name contains this")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="where to write the JSON results")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, function in all_benchmarks().items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = time_benchmark(function, args.repeat)
+        print(f"{name:55} {results[name]['best_s'] * 1e6:12.1f} us")
+
+    commit = current_commit()
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit or 'results'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'commit': commit,
+                   'created_at': datetime.now(timezone.utc).isoformat(),
+                   'python': sys.version.split()[0],
+                   'platform': platform.platform(),
+                   'benchmarks': results}, f, indent=4, sort_keys=True)
+    print(f"Wrote {output}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+The real application from main.make_app with every client pointed at the stub
+providers instead of the internet:
+
+    python -m loadtest.app --port 8899 --stub http://127.0.0.1:9000 --workers 4
+
+It's served the way SERVER_MODE=production serves it, by --workers forked
+processes (one per core if 0). Provider rate limits and quotas are lifted, the
+stub has no budget to protect, the API keys are replaced with placeholders so
+real ones never leave .env, and nothing is archived.
+"""
+import argparse
+import logging
+import os
+
+API_KEYS = ['ACCUWEATHER_API_KEY', 'MET_OFFICE_API_KEY', 'OPEN_WEATHER_API_KEY', 'STORM_GLASS_API_KEY',
+            'THE_RAINERY_API_KEY', 'TOMORROW_API_KEY', 'WEATHER_API_KEY', 'WEATHERBIT_IO_API_KEY']
+# Before the clients are imported, they read their keys at import time
+for key in API_KEYS:
+    os.environ[key] = 'loadtest'
+os.environ['ARCHIVE'] = '0'
+
+from main import serve_production
+
+from .stub import STUB_PATHS
+
+
+def point_clients_at(factory, stub_url):
+    for client in factory.get_all_members():
+        client.base_url = stub_url.rstrip('/') + STUB_PATHS[type(client).__name__]
+        client.requests_per_minute = None
+        client.daily_quota = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8899)
+    parser.add_argument('--stub', default="http://127.0.0.1:9000")
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "WARNING"))
+    print("App listening on %s with %s workers, providers at %s" % (args.port, args.workers, args.stub))
+    serve_production(args.port, args.workers, address='127.0.0.1',
+                     configure=lambda factory: point_clients_at(factory, args.stub))
+
+
+if __name__ == '__main__':
+    main()
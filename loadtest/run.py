@@ -0,0 +1,174 @@
+"""
+End to end load test. Starts the stub providers and the real app (see
+loadtest.stub and loadtest.app) in their own processes, then drives the app's
+endpoints at a fixed concurrency and reports throughput and p50 / p95 / p99
+latency per endpoint:
+
+    python -m loadtest.run --concurrency 50 --duration 30 --latency-ms 80
+
+Use --target to load an already running app instead, and --output to keep the
+report as JSON. Requests are spread over --points distinct locations, fewer
+points means more forecast cache hits.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError, HTTPRequest
+from tornado.ioloop import IOLoop
+
+from .stub import add_profile_arguments, profile_arguments
+
+DEFAULT_MIX = "get_weather=6,single_weather=3,batch_weather=1"
+
+
+class LoadGenerator:
+    def __init__(self, base_url, concurrency, duration, mix, points, batch_size, seed=0):
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.duration = duration
+        self.endpoints, self.weights = zip(*mix.items())
+        self.rng = random.Random(seed)
+        # Spread over the UK, at 2dp so each point is its own forecast cache entry
+        self.points = [(round(self.rng.uniform(50.0, 58.0), 2), round(self.rng.uniform(-5.0, 1.0), 2))
+                       for _ in range(points)]
+        self.batch_size = batch_size
+        self.samples = {endpoint: [] for endpoint in self.endpoints}
+        self.failures = {endpoint: 0 for endpoint in self.endpoints}
+        self.client = AsyncHTTPClient(max_clients=concurrency)
+
+    def make_request(self, endpoint):
+        lat, lon = self.rng.choice(self.points)
+        if endpoint == 'batch_weather':
+            body = json.dumps({'points': [{'lat': lat, 'lon': lon}
+                                          for lat, lon in self.rng.sample(self.points, min(self.batch_size, len(self.points)))]})
+            return HTTPRequest(f"{self.base_url}/batch_weather", method='POST', body=body, request_timeout=120)
+        return HTTPRequest(f"{self.base_url}/{endpoint}?lat={lat}&lon={lon}", request_timeout=120)
+
+    async def worker(self, deadline):
+        while time.monotonic() < deadline:
+            endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+            start = time.monotonic()
+            try:
+                await self.client.fetch(self.make_request(endpoint))
+            except (HTTPClientError, OSError):
+                self.failures[endpoint] += 1
+            else:
+                self.samples[endpoint].append(time.monotonic() - start)
+
+    async def run(self):
+        start = time.monotonic()
+        await gen.multi([self.worker(start + self.duration) for _ in range(self.concurrency)])
+        return self.report(time.monotonic() - start)
+
+    def report(self, elapsed):
+        endpoints = {}
+        for endpoint in self.endpoints:
+            samples = np.array(self.samples[endpoint]) * 1000
+            endpoints[endpoint] = summarise(samples, self.failures[endpoint], elapsed)
+        all_samples = np.concatenate([np.array(self.samples[endpoint]) * 1000 for endpoint in self.endpoints])
+        return {'concurrency': self.concurrency, 'duration_s': round(elapsed, 3), 'points': len(self.points),
+                'total': summarise(all_samples, sum(self.failures.values()), elapsed),
+                'endpoints': endpoints}
+
+
+def summarise(latencies_ms, failures, elapsed):
+    summary = {'requests': int(len(latencies_ms)), 'failures': failures,
+               'throughput_rps': round(len(latencies_ms) / elapsed, 2)}
+    if len(latencies_ms):
+        p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+        summary.update(p50_ms=round(p50, 2), p95_ms=round(p95, 2), p99_ms=round(p99, 2),
+                       max_ms=round(float(latencies_ms.max()), 2))
+    return summary
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        endpoint, _, weight = part.partition('=')
+        weights[endpoint.strip()] = float(weight or 1)
+    return weights
+
+
+def wait_for(url, timeout=60):
+    """Polls url until it answers, so the load doesn't start before the servers are listening"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("%s didn't come up within %ss" % (url, timeout))
+
+
+def start_servers(args):
+    """Starts the stub and the app with a throwaway cache directory, returns (processes, app url)"""
+    env = {**os.environ, 'CACHE_DIR': tempfile.mkdtemp(prefix='weather-loadtest-')}
+    # Every provider is on the one stub host, give it the per host connections eight hosts would have
+    env.setdefault('HTTP_MAX_PER_HOST', '128')
+    env.setdefault('HTTP_MAX_CLIENTS', '256')
+    output = None if args.verbose else subprocess.DEVNULL
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    processes = [subprocess.Popen([sys.executable, '-m', 'loadtest.stub', '--port', str(args.stub_port),
+                                   *profile_arguments(args)], env=env, stdout=output, stderr=output)]
+    wait_for(stub_url + '/')
+    processes.append(subprocess.Popen([sys.executable, '-m', 'loadtest.app', '--port', str(args.app_port),
+                                       '--stub', stub_url, '--workers', str(args.workers)], env=env, stdout=output, stderr=output))
+    wait_for(app_url + '/')
+    return processes, app_url
+
+
+def print_report(report):
+    print(f"\n{report['concurrency']} concurrent clients for {report['duration_s']}s over {report['points']} points")
+    print(f"{'endpoint':16} {'requests':>9} {'failures':>9} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, summary in [*report['endpoints'].items(), ('total', report['total'])]:
+        print(f"{name:16} {summary['requests']:9} {summary['failures']:9} {summary['throughput_rps']:9} "
+              f"{summary.get('p50_ms', '-'):>9} {summary.get('p95_ms', '-'):>9} {summary.get('p99_ms', '-'):>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=30, help="seconds to run for")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="relative weights of the endpoints to call")
+    parser.add_argument('--points', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=20, help="points per /batch_weather request")
+    parser.add_argument('--target', help="URL of an app that's already running, skips starting the servers")
+    parser.add_argument('--app-port', type=int, default=8899)
+    parser.add_argument('--workers', type=int, default=1, help="app processes, one per core if 0")
+    parser.add_argument('--stub-port', type=int, default=9000)
+    parser.add_argument('--output', help="where to write the report as JSON")
+    parser.add_argument('--verbose', action='store_true', help="show the stub and app logs")
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    processes, base_url = [], args.target
+    if base_url is None:
+        processes, base_url = start_servers(args)
+    try:
+        generator = LoadGenerator(base_url, args.concurrency, args.duration, parse_mix(args.mix),
+                                  args.points, args.batch_size)
+        report = IOLoop.current().run_sync(generator.run)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Stand-in for all eight providers' APIs, serving the recorded payloads from
+benchmarks/payloads with configurable latency, errors and timeouts:
+
+    python -m loadtest.stub --port 9000 --latency-ms 80 --error-rate 0.01
+
+Every provider gets the same behaviour unless --profiles names a JSON file
+of per provider overrides, e.g. {"storm_glass": {"latency_ms": 900}}.
+"""
+import argparse
+import json
+import random
+
+import tornado.gen
+import tornado.ioloop
+import tornado.web
+
+from benchmarks.payloads import load_body, make_sitelist
+
+# Where each client's base_url points on the stub, see loadtest.app
+STUB_PATHS = {
+    'AccuWeatherClient': '/accuweather/',
+    'MetOfficeClient': '/met_office/',
+    'OpenWeatherClient': '/open_weather/data/2.5/onecall',
+    'StormGlassClient': '/storm_glass/v2',
+    'TheRaineryClient': '/the_rainery/forecast/weather',
+    'TomorrowIOClient': '/tomorrow_io/v4/timelines',
+    'WeatherApiClient': '/weather_api/v1/',
+    'WeatherbitIoClient': '/weather_bit/v2.0/forecast/hourly',
+}
+# (provider, path pattern, payload name), the first matching pattern wins
+ROUTES = [
+    ('accuweather', r"/accuweather/+locations/v1/cities/geoposition/search", 'accuweather_location'),
+    ('accuweather', r"/accuweather/+forecasts/v1/hourly/12hour/[^/]+", 'accuweather'),
+    ('met_office', r"/met_office/val/wxfcs/all/json/sitelist", None),
+    ('met_office', r"/met_office/val/wxfcs/all/json/[^/]+", 'met_office'),
+    ('open_weather', r"/open_weather/data/2\.5/onecall", 'open_weather'),
+    ('storm_glass', r"/storm_glass/v2/weather/point", 'storm_glass'),
+    ('the_rainery', r"/the_rainery/forecast/weather", 'the_rainery'),
+    ('tomorrow_io', r"/tomorrow_io/v4/timelines", 'tomorrow_io'),
+    ('weather_api', r"/weather_api/v1/forecast\.json", 'weather_api'),
+    ('weather_bit', r"/weather_bit/v2\.0/forecast/hourly", 'weather_bit'),
+]
+
+
+class Profile:
+    """
+    How a stubbed provider behaves. Latency is lognormal around latency_ms,
+    sigma 0 makes it fixed. A timed out request is held for timeout_s before
+    getting a 504, which should be longer than the app's PROVIDER_TIMEOUT.
+    """
+
+    def __init__(self, latency_ms=50, latency_sigma=0.5, error_rate=0.0, timeout_rate=0.0, timeout_s=30, seed=None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_s = timeout_s
+        self.rng = random.Random(seed)
+
+    def latency(self):
+        if not self.latency_sigma:
+            return self.latency_ms / 1000
+        return self.latency_ms * self.rng.lognormvariate(0, self.latency_sigma) / 1000
+
+    def outcome(self):
+        """Returns 'timeout', 'error' or 'ok' for the next request"""
+        draw = self.rng.random()
+        if draw < self.timeout_rate:
+            return 'timeout'
+        if draw < self.timeout_rate + self.error_rate:
+            return 'error'
+        return 'ok'
+
+
+class StubHandler(tornado.web.RequestHandler):
+    def initialize(self, body, profile, stats):
+        self.body = body
+        self.profile = profile
+        self.stats = stats
+
+    async def get(self):
+        outcome = self.profile.outcome()
+        self.stats[outcome] = self.stats.get(outcome, 0) + 1
+        if outcome == 'timeout':
+            await tornado.gen.sleep(self.profile.timeout_s)
+            raise tornado.web.HTTPError(504)
+        await tornado.gen.sleep(self.profile.latency())
+        if outcome == 'error':
+            raise tornado.web.HTTPError(500)
+        self.set_header('Content-Type', 'application/json')
+        self.write(self.body)
+
+
+class RootHandler(tornado.web.RequestHandler):
+    """Answers the connection warming HEAD requests, and the harness checking the stub is up"""
+
+    def head(self):
+        pass
+
+    def get(self):
+        self.write("stub")
+
+
+def make_stub_app(default_profile=None, profiles=None, seed=0):
+    default_profile = default_profile or {}
+    profiles = profiles or {}
+    stats = {}
+    handlers = [(r"/", RootHandler)]
+    for index, (provider, pattern, payload_name) in enumerate(ROUTES):
+        body = json.dumps(make_sitelist()).encode() if payload_name is None else load_body(payload_name)
+        profile = Profile(**{**default_profile, **profiles.get(provider, {})}, seed=seed + index)
+        handlers.append((pattern, StubHandler, dict(
+            body=body, profile=profile, stats=stats.setdefault(provider, {}))))
+    app = tornado.web.Application(handlers)
+    app.stats = stats
+    return app
+
+
+def add_profile_arguments(parser):
+    parser.add_argument('--latency-ms', type=float, default=50, help="median provider latency")
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help="lognormal shape of the latency, 0 for fixed")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with a 500")
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help="fraction of requests held for --timeout-s")
+    parser.add_argument('--timeout-s', type=float, default=30)
+    parser.add_argument('--profiles', help="JSON file of per provider overrides of the above")
+
+
+def profile_arguments(args):
+    """Turns parsed add_profile_arguments options back into command line arguments"""
+    argv = ['--latency-ms', str(args.latency_ms), '--latency-sigma', str(args.latency_sigma),
+            '--error-rate', str(args.error_rate), '--timeout-rate', str(args.timeout_rate),
+            '--timeout-s', str(args.timeout_s)]
+    return argv + (['--profiles', args.profiles] if args.profiles else [])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=9000)
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    profiles = {}
+    if args.profiles:
+        with open(args.profiles) as f:
+            profiles = json.load(f)
+    default_profile = dict(latency_ms=args.latency_ms, latency_sigma=args.latency_sigma, error_rate=args.error_rate,
+                           timeout_rate=args.timeout_rate, timeout_s=args.timeout_s)
+    make_stub_app(default_profile, profiles).listen(args.port, address='127.0.0.1')
+    print("Stub providers listening on %s" % args.port)
+    tornado.ioloop.IOLoop.current().start()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,113 @@
 import tornado.ioloop
 import tornado.web
 import tornado.gen
+import tornado.httpserver
+import tornado.iostream
+import tornado.netutil
+import tornado.process
+import asyncio
+import hmac
 import json
+import logging
+import math
+import os
+import signal
+import time
+from os import getenv
 from dotenv import load_dotenv
+from weather_clients import metrics, tracing
+from weather_clients.archive import archive
+from weather_clients.disk_cache import enable_incremental_vacuum_all, start_compaction
+from weather_clients.ensemble import build_ensemble
 from weather_clients.factory import Factory
+from weather_clients.geocoding import city_geocoder, postcode_geocoder
+from weather_clients.parsing import parser
+from weather_clients.profiling import SORT_KEYS, ProfilerBusy, profiler
+from weather_clients.rate_limit import scheduler
+from weather_clients.transport import transport
+from weather_clients.serialization import SERIALIZERS, choose_serializer
 
 
 # Load env variables
 load_dotenv()
+logger = logging.getLogger(__name__)
+
+DEFAULT_LAT = 50.73862
+DEFAULT_LON = -2.90325
+
+
+def parse_lat_lon(lat, lon, where=''):
+    """Returns lat and lon as floats, or a 400 if they aren't valid coordinates"""
+    try:
+        lat, lon = float(lat), float(lon)
+    except (ValueError, TypeError, OverflowError):
+        raise tornado.web.HTTPError(400, reason="Invalid %slat / lon" % where)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise tornado.web.HTTPError(400, reason="Out of range %slat / lon" % where)
+    return lat, lon
+
+
+def parse_positive_float(value, name):
+    """Returns value as a float, None if it wasn't given, or a 400 unless it's finite and above 0"""
+    if value is None:
+        return None
+    try:
+        number = float(value)
+    except (ValueError, TypeError, OverflowError):
+        raise tornado.web.HTTPError(400, reason="Invalid %s" % name)
+    if not 0 < number < math.inf:
+        raise tornado.web.HTTPError(400, reason="%s must be a positive number" % name)
+    return number
+
+
+def parse_flag(value, name):
+    """Returns a query argument as a bool, absent or empty being False, or a 400 if it's not one"""
+    if value is None or value.lower() in ('', '0', 'false', 'no', 'off'):
+        return False
+    if value.lower() in ('1', 'true', 'yes', 'on'):
+        return True
+    raise tornado.web.HTTPError(400, reason="Invalid %s, expected true or false" % name)
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, factory):
+        self.factory = factory
+        self.trace = None
+        self.in_flight = False
+
+    def prepare(self):
+        metrics.http_in_flight.inc()
+        self.in_flight = True
+        if self.application.draining:
+            self.set_header('Connection', 'close')
+        self.trace = tracing.tracer.start(self.__class__.__name__, uri=self.request.uri)
+
+    def on_finish(self):
+        if self.in_flight:
+            metrics.http_in_flight.dec()
+            self.in_flight = False
+        tracing.tracer.finish(self.trace)
+
+    def get_lat_lon(self):
+        return parse_lat_lon(self.get_query_argument('lat', DEFAULT_LAT),
+                             self.get_query_argument('lon', DEFAULT_LON))
+
+    def write_serialized(self, data):
+        """Writes data in the format asked for by the format query arg or Accept header"""
+        try:
+            serializer = choose_serializer(self.get_query_argument('format', None),
+                                           self.request.headers.get('Accept'))
+        except ValueError as e:
+            raise tornado.web.HTTPError(400, reason=str(e))
+        self.set_header('Content-Type', serializer.content_type)
+        self.write(self.encode(serializer, data))
+
+    def encode(self, serializer, data):
+        start = time.perf_counter()
+        with tracing.span('serialize', format=serializer.name):
+            encoded = serializer.encode(data)
+        metrics.serialize_seconds.labels(serializer.name).observe(time.perf_counter() - start)
+        return encoded
 
 
 class MainHandler(tornado.web.RequestHandler):
@@ -16,34 +116,334 @@ class MainHandler(tornado.web.RequestHandler):
         self.render("index.html")
 
 
-class SingleWeatherHandler(tornado.web.RequestHandler):
+class SingleWeatherHandler(BaseHandler):
     @tornado.gen.coroutine
     def get(self):
-        weather_client = Factory().instantiate_member('WeatherbitIoClient')
-        data = yield [weather_client.get_forecast_lat_lon(lat=50.73862, lon=-2.90325)]
-        self.write(json.dumps(data, default=str))
+        lat, lon = self.get_lat_lon()
+        weather_client = self.factory.get_member('WeatherbitIoClient')
+        data = yield [self.factory.forecast_cache.get_forecast_lat_lon(weather_client, lat=lat, lon=lon)]
+        self.write_serialized(data)
+
 
+class WeatherHandler(BaseHandler):
+    def aggregate_options(self):
+        return dict(deadline=parse_positive_float(self.get_query_argument('deadline', None), 'deadline'),
+                    provider_timeout=parse_positive_float(self.get_query_argument('timeout', None), 'timeout'),
+                    hedge=parse_flag(self.get_query_argument('hedge', None), 'hedge'))
 
-class WeatherHandler(tornado.web.RequestHandler):
     @tornado.gen.coroutine
     def get(self):
-        factory = Factory()
-        weather_clients = factory.instantiate_all_members()
-        all_forecasts = yield {cls.__class__.__name__: cls.get_forecast_lat_lon(
-            lat=50.73862, lon=-2.90325) for cls in weather_clients}
-        self.write(json.dumps(all_forecasts, indent=4,
-                   sort_keys=True, default=str))
+        lat, lon = self.get_lat_lon()
+        weather_clients = self.factory.get_all_members()
+        stream_format = self.get_query_argument('stream', None)
+        if stream_format:
+            yield self.stream_forecasts(weather_clients, lat, lon, stream_format)
+            return
+        if parse_flag(self.get_query_argument('partial', None), 'partial'):
+            # Return whatever providers finish in time, with per provider status and timings
+            start = time.monotonic()
+            results = yield self.factory.aggregator.aggregate(
+                weather_clients, lat=lat, lon=lon, **self.aggregate_options())
+            self.write_serialized({'elapsed_ms': round((time.monotonic() - start) * 1000, 1),
+                                   'providers': results})
+            return
+        forecast_cache = self.factory.forecast_cache
+        all_forecasts = yield {cls.__class__.__name__: forecast_cache.get_forecast_lat_lon(
+            cls, lat=lat, lon=lon) for cls in weather_clients}
+        self.write_serialized(all_forecasts)
+
+    async def stream_forecasts(self, weather_clients, lat, lon, stream_format):
+        """Writes one NDJSON line or server sent event per provider as soon as it finishes"""
+        sse = stream_format == 'sse'
+        serializer = SERIALIZERS['json']
+        if sse:
+            self.set_header('Content-Type', 'text/event-stream')
+            self.set_header('Cache-Control', 'no-cache')
+        else:
+            self.set_header('Content-Type', 'application/x-ndjson')
+        try:
+            for next_result in self.factory.aggregator.as_completed(
+                    weather_clients, lat=lat, lon=lon, **self.aggregate_options()):
+                name, result = await next_result
+                chunk = self.encode(serializer, {'provider': name, **result})
+                self.write(b"event: forecast\ndata: " + chunk + b"\n\n" if sse else chunk + b"\n")
+                await self.flush()
+            if sse:
+                self.write("event: done\ndata: {}\n\n")
+        except tornado.iostream.StreamClosedError:
+            # Client went away, nothing left to send to
+            pass
+
+
+class EnsembleHandler(BaseHandler):
+    @tornado.gen.coroutine
+    def get(self):
+        """Combines every provider that answers in time into one hourly forecast with spread"""
+        lat, lon = self.get_lat_lon()
+        results = yield self.factory.aggregator.aggregate(self.factory.get_all_members(), lat=lat, lon=lon)
+        forecasts = {name: result['data'] for name, result in results.items() if result['status'] == 'ok'}
+        ensemble = build_ensemble(forecasts)
+        self.write_serialized({'lat': lat, 'lon': lon, **ensemble})
+
+
+class BatchWeatherHandler(BaseHandler):
+    MAX_POINTS = 1000
+
+    async def parse_points(self):
+        """
+        Reads {"points": [{"lat": .., "lon": ..} or {"country": .., "postcode": ..}, ...],
+        "providers": [optional client names]} from the request body. Postcodes are
+        looked up a country at a time, unknown ones are reported per point.
+        """
+        try:
+            body = json.loads(self.request.body)
+            raw_points = list(body['points'])
+            clients = [self.factory.get_member(name) for name in body.get('providers', [])]
+        except (ValueError, KeyError, TypeError) as e:
+            raise tornado.web.HTTPError(400, reason="Invalid batch request: %s" % e)
+        if len(raw_points) > self.MAX_POINTS:
+            raise tornado.web.HTTPError(400, reason="At most %s points per batch" % self.MAX_POINTS)
+        points, errors = {}, {}
+        postcodes = {}
+        for index, point in enumerate(raw_points):
+            if not isinstance(point, dict):
+                raise tornado.web.HTTPError(400, reason="Point %s isn't an object" % index)
+            if 'postcode' in point:
+                postcodes.setdefault(str(point.get('country', '')), []).append((index, point['postcode']))
+            else:
+                points[index] = parse_lat_lon(point.get('lat'), point.get('lon'), "point %s " % index)
+        for country, entries in postcodes.items():
+            try:
+                locations = await postcode_geocoder.lookup_many(country, [postcode for _, postcode in entries])
+            except ValueError as e:
+                errors.update((index, str(e)) for index, _ in entries)
+                continue
+            for (index, _), location in zip(entries, locations):
+                if location is None:
+                    errors[index] = "Couldn't geocode that postcode."
+                else:
+                    points[index] = location
+        return points, errors, clients or self.factory.get_all_members()
+
+    async def post(self):
+        """Streams NDJSON, one line per provider and distinct location, listing the points it covers"""
+        points, errors, clients = await self.parse_points()
+        serializer = SERIALIZERS['json']
+        self.set_header('Content-Type', 'application/x-ndjson')
+        for index, error in errors.items():
+            self.write(self.encode(serializer, {'points': [index], 'status': 'error', 'error': error}) + b"\n")
+        try:
+            async for result in self.factory.batch.forecasts(clients, points):
+                self.write(self.encode(serializer, result) + b"\n")
+                await self.flush()
+        except tornado.iostream.StreamClosedError:
+            pass
+
+
+class AutocompleteHandler(BaseHandler):
+    def get(self):
+        """Suggests place names from the offline gazetteer as the user types"""
+        prefix = self.get_argument('q', '')
+        country = self.get_argument('country', None)
+        try:
+            limit = int(self.get_argument('limit', 10))
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="Invalid limit")
+        limit = min(max(limit, 1), 10)
+        self.write_serialized({'places': city_geocoder.gazetteer.autocomplete(prefix, country, limit)})
+
+
+class MetricsHandler(BaseHandler):
+    def get(self):
+        """Prometheus scrape endpoint"""
+        metrics.forecast_cache_entries.set(len(self.factory.forecast_cache))
+        for provider, usage in scheduler.usage().items():
+            metrics.quota_used.labels(provider).set(usage['used_today'])
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(metrics.registry.render())
+
+
+class ProfileHandler(BaseHandler):
+    async def get(self):
+        """
+        Profiles the IOLoop for ?seconds=N (default 10, at most 120) and returns
+        the result as text. mode=cprofile (the default) gives pstats output
+        ordered by ?sort=, mode=sample gives folded stacks sampled every
+        ?interval_ms= (default 5, at least 1). Needs the ADMIN_TOKEN in an
+        X-Admin-Token header, and is switched off when ADMIN_TOKEN isn't set.
+        """
+        admin_token = getenv("ADMIN_TOKEN")
+        if not admin_token:
+            raise tornado.web.HTTPError(404)
+        if not hmac.compare_digest(self.request.headers.get('X-Admin-Token', ''), admin_token):
+            raise tornado.web.HTTPError(403)
+        seconds = min(parse_positive_float(self.get_query_argument('seconds', '10'), 'seconds'), 120)
+        mode = self.get_query_argument('mode', 'cprofile')
+        try:
+            if mode == 'cprofile':
+                sort = self.get_query_argument('sort', 'cumulative')
+                if sort not in SORT_KEYS:
+                    raise tornado.web.HTTPError(400, reason="sort must be one of " + ", ".join(SORT_KEYS))
+                report = await profiler.cprofile(seconds, sort=sort)
+            elif mode == 'sample':
+                interval_ms = parse_positive_float(self.get_query_argument('interval_ms', '5'), 'interval_ms')
+                if interval_ms < 1:
+                    # Any faster and the sampler thread starves the IOLoop it's meant to be watching
+                    raise tornado.web.HTTPError(400, reason="interval_ms must be at least 1")
+                report = await profiler.sample(seconds, interval=interval_ms / 1000)
+            else:
+                raise tornado.web.HTTPError(400, reason="mode must be cprofile or sample")
+        except ProfilerBusy as e:
+            raise tornado.web.HTTPError(409, reason=str(e))
+        self.set_header('Content-Type', 'text/plain; charset=utf-8')
+        self.write(report)
 
 
-def make_app():
-    return tornado.web.Application([
+class WeatherApplication(tornado.web.Application):
+    # Set while shutting down, so keep-alive clients go elsewhere for their next request
+    draining = False
+
+    def log_request(self, handler):
+        metrics.observe_request(handler)
+        super().log_request(handler)
+
+
+def make_app(factory=None, debug=True):
+    if factory is None:
+        factory = Factory()
+    shared = dict(factory=factory)
+    return WeatherApplication([
         (r"/", MainHandler),
-        (r"/single_weather", SingleWeatherHandler),
-        (r"/get_weather", WeatherHandler),
-    ], debug=True, autoreload=True, template_path="templates")
+        (r"/single_weather", SingleWeatherHandler, shared),
+        (r"/get_weather", WeatherHandler, shared),
+        (r"/ensemble", EnsembleHandler, shared),
+        (r"/batch_weather", BatchWeatherHandler, shared),
+        (r"/autocomplete", AutocompleteHandler, shared),
+        (r"/metrics", MetricsHandler, shared),
+        (r"/admin/profile", ProfileHandler, shared),
+    ], debug=debug, autoreload=debug, template_path="templates")
 
 
-if __name__ == "__main__":
-    app = make_app()
-    app.listen(8888)
+async def drain(app, server, factory, grace_seconds):
+    """
+    Stops accepting connections, then waits up to grace_seconds for requests
+    being handled and upstream fetches in flight (including ones nobody is
+    waiting on any more, so their results still reach the caches) to finish,
+    then writes out whatever the archive has buffered. Keep-alive connections
+    are told to close with each response and closed once nothing is in flight.
+    """
+    logger.info("Shutting down, draining for up to %ss", grace_seconds)
+    app.draining = True
+    server.stop()
+    factory.prefetcher.stop()
+    deadline = time.monotonic() + grace_seconds
+    while time.monotonic() < deadline and metrics.http_in_flight.labels().value > 0:
+        await tornado.gen.sleep(0.1)
+    await server.close_all_connections()
+    while time.monotonic() < deadline and factory.forecast_cache.fetches_in_flight():
+        await tornado.gen.sleep(0.1)
+    archive.stop()
+    await archive.flush()
+    tornado.ioloop.IOLoop.current().stop()
+
+
+def handle_shutdown(app, server, factory, lifeline=None):
+    """
+    Drains on SIGTERM or SIGINT, or once the parent closes the lifeline pipe
+    when this is a forked worker
+    """
+    grace_seconds = float(getenv("SHUTDOWN_GRACE_SECONDS", 20))
+    io_loop = tornado.ioloop.IOLoop.current()
+    draining = False
+
+    def shutdown(*args):
+        nonlocal draining
+        if draining:
+            return
+        draining = True
+        if lifeline is not None:
+            io_loop.remove_handler(lifeline)
+        io_loop.add_callback(drain, app, server, factory, grace_seconds)
+
+    def on_signal(signum, frame):
+        io_loop.add_callback_from_signal(shutdown)
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+    if lifeline is not None:
+        io_loop.add_handler(lifeline, shutdown, io_loop.READ)
+
+
+def serve(sockets, debug, processes=1, task_id=None, lifeline=None, configure=None):
+    """
+    Runs one server process on already bound sockets until it's told to shut
+    down. configure, if given, is called with the Factory before anything uses it.
+    """
+    transport.configure_from_env()
+    scheduler.configure(processes)
+    factory = Factory()
+    if configure is not None:
+        configure(factory)
+    app = make_app(factory, debug=debug)
+    tornado.ioloop.IOLoop.current().run_sync(factory.warm)
+    server = tornado.httpserver.HTTPServer(app, xheaders=True)
+    server.add_sockets(sockets)
+    # One process is enough to keep the shared caches compact
+    if not task_id:
+        start_compaction()
+    factory.prefetcher.start()
+    archive.start()
+    handle_shutdown(app, server, factory, lifeline)
+    logger.info("Serving on %s%s", ', '.join(str(sock.getsockname()) for sock in sockets),
+                '' if task_id is None else ' as worker %s' % task_id)
     tornado.ioloop.IOLoop.current().start()
+    parser.shutdown()
+
+
+def serve_production(port, workers, address=None, configure=None):
+    """
+    Forks workers processes (one per core if 0) sharing one listening socket.
+    Shared state lives in the sqlite caches, which the parent fills once before
+    forking so the workers start from the same sitelist and location keys.
+    Nothing may create an IOLoop in the parent before the fork.
+    """
+    sockets = tornado.netutil.bind_sockets(port, address=address)
+    enable_incremental_vacuum_all()
+    workers = workers or tornado.process.cpu_count()
+    transport.configure_from_env()
+    # So the parent's own fetches are within one worker's share of the limits too
+    scheduler.configure(workers)
+    factory = Factory()
+    if configure is not None:
+        configure(factory)
+    asyncio.run(factory.prefill())
+    # Workers drain and exit once this pipe closes, which happens when the parent
+    # is told to stop, or dies. Exiting cleanly stops fork_processes restarting them.
+    lifeline, lifeline_writer = os.pipe()
+    stopping = False
+
+    def on_signal(signum, frame):
+        nonlocal stopping
+        stopping = True
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        os.close(lifeline_writer)
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+    task_id = tornado.process.fork_processes(workers)
+    if stopping:
+        # A worker that died while the rest drain is restarted into a closed lifeline, just let it go
+        os._exit(0)
+    os.close(lifeline_writer)
+    serve(sockets, debug=False, processes=workers, task_id=task_id, lifeline=lifeline, configure=configure)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    port = int(getenv("PORT", 8888))
+    if getenv("SERVER_MODE", "development") == "production":
+        serve_production(port, int(getenv("WORKERS", 0)))
+    else:
+        enable_incremental_vacuum_all()
+        serve(tornado.netutil.bind_sockets(port), debug=True)
@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta, timezone
+
+from weather_clients.archive import ForecastArchive
+from weather_clients.weather_apis.utils.forecast_series import ForecastSeries
+
+DAY = 86400
+
+
+def write_day(archive, fetched_at, name):
+    series = ForecastSeries(50.74, -2.9)
+    issued = datetime.fromtimestamp(fetched_at, timezone.utc)
+    for hours in range(0, 48, 6):
+        series.append(issued + timedelta(hours=hours), temperature=float(hours))
+    return archive.write_segment([('TestClient', 50.74, -2.9, fetched_at, series)], name)
+
+
+def test_scan_skips_the_days_that_cant_hold_the_range(tmp_path):
+    archive = ForecastArchive(path=str(tmp_path), max_horizon_days=2)
+    first = datetime(2024, 5, 1, 12, tzinfo=timezone.utc).timestamp()
+    for day in range(10):
+        write_day(archive, first + day * DAY, str(day))
+    start, end = first + 5 * DAY, first + 6 * DAY
+
+    expected = ForecastArchive(path=str(tmp_path), max_horizon_days=1000).scan('TestClient', start=start, end=end)
+    result = archive.scan('TestClient', start=start, end=end)
+    assert sorted(result['valid_time']) == sorted(expected['valid_time'])
+    assert len(result['valid_time']) == 8
+    # Written too long before start, or after end, so never opened
+    scanned_days = {segment.split('/')[-2] for segment in archive._meta}
+    assert scanned_days == {'2024-05-0%d' % day for day in range(3, 9)}
@@ -0,0 +1,16 @@
+from datetime import datetime
+
+from weather_clients.serialization import SERIALIZERS
+from weather_clients.weather_apis.utils.definitions import uv_lookup_codes
+from weather_clients.weather_apis.utils.forecast_series import ForecastSeries
+
+
+def test_uv_index_past_the_lookup_table_is_described_as_extreme():
+    series = ForecastSeries(50.74, -2.9)
+    for hour, uv_index in enumerate([3, 11, 12, 14.5]):
+        series.append(datetime(2024, 6, 21, hour), uv_index=uv_index)
+    rows = series.to_rows()
+    assert rows[0]['uv_index']['description'] == uv_lookup_codes['3']
+    assert [row['uv_index']['description'] for row in rows[1:]] == [uv_lookup_codes['11']] * 3
+    assert rows[2]['uv_index']['code'] == 12
+    SERIALIZERS['json'].encode({'TestClient': series})
@@ -0,0 +1,19 @@
+import asyncio
+
+from weather_clients.rate_limit import ProviderLimiter, QuotaExceeded, quota_ledger
+
+
+def test_waiters_for_tokens_cant_overshoot_the_daily_quota(tmp_path, monkeypatch):
+    monkeypatch.setenv("CACHE_DIR", str(tmp_path))
+    limiter = ProviderLimiter("QuotaTestClient", requests_per_minute=6000, daily_quota=10)
+    # Empty bucket, so every acquire waits for a token after any check made on the way in
+    limiter.bucket.tokens = 0
+
+    async def acquire_all():
+        return await asyncio.gather(*[limiter.acquire(max_wait=5) for _ in range(30)], return_exceptions=True)
+
+    results = asyncio.run(acquire_all())
+    assert sum(result is None for result in results) == 10
+    assert all(isinstance(result, QuotaExceeded) for result in results if result is not None)
+    assert limiter.used_today() == 10
+    quota_ledger.delete(limiter.ledger_key)
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from os import getenv
+
+from . import metrics
+from .rate_limit import QuotaExceeded
+
+
+class Aggregator:
+    """
+    Fans a forecast request out to many clients and collects whatever comes
+    back before the deadline. Each provider gets its own timeout, failures and
+    timeouts are reported per provider rather than failing the whole request.
+    With hedging on, a provider that is slower than its own p95 upstream
+    latency, as recorded by the forecast cache, gets a second request and the
+    first of the two to finish wins.
+    """
+
+    def __init__(self, forecast_cache, deadline=None, provider_timeout=None):
+        self.forecast_cache = forecast_cache
+        self.deadline = float(deadline or getenv("AGGREGATE_DEADLINE", 15))
+        self.provider_timeout = float(provider_timeout or getenv("PROVIDER_TIMEOUT", 10))
+        self.latencies = forecast_cache.latencies
+
+    async def fetch_one(self, client, lat, lon, timeout, hedge=False):
+        """Returns (provider name, result dict with status, timing and data or error)"""
+        name = client.__class__.__name__
+        start = time.monotonic()
+        tasks = {asyncio.ensure_future(self.forecast_cache.get_forecast_lat_lon(client, lat, lon))}
+        hedged = False
+        error = None
+        try:
+            p95 = self.latencies.percentile(name, 95) if hedge else None
+            if p95 is not None and p95 < timeout:
+                done, _ = await asyncio.wait(tasks, timeout=p95)
+                if not done:
+                    # Go straight to the client, the cache would just join the slow request
+                    lat, lon = self.forecast_cache.normalise(lat, lon)
+                    tasks.add(asyncio.ensure_future(client.get_forecast_lat_lon(lat=lat, lon=lon)))
+                    hedged = True
+            while tasks:
+                remaining = timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    break
+                done, tasks = await asyncio.wait(
+                    tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        elapsed = time.monotonic() - start
+                        metrics.provider_results.labels(name, 'ok').inc()
+                        return name, {'status': 'ok', 'elapsed_ms': round(elapsed * 1000, 1),
+                                      'hedged': hedged, 'data': task.result()}
+                    error = task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if error is None:
+            status = 'timeout'
+        elif isinstance(error, QuotaExceeded):
+            status = 'skipped'
+        else:
+            status = 'error'
+        metrics.provider_results.labels(name, status).inc()
+        result = {'status': status,
+                  'elapsed_ms': round((time.monotonic() - start) * 1000, 1),
+                  'hedged': hedged}
+        if error is not None:
+            result['error'] = str(error) or error.__class__.__name__
+        return name, result
+
+    def as_completed(self, clients, lat, lon, deadline=None, provider_timeout=None, hedge=False):
+        """Returns an iterator of awaitables giving (name, result) in the order providers finish"""
+        timeout = min(deadline or self.deadline, provider_timeout or self.provider_timeout)
+        return asyncio.as_completed([self.fetch_one(client, lat, lon, timeout, hedge)
+                                     for client in clients])
+
+    async def aggregate(self, clients, lat, lon, deadline=None, provider_timeout=None, hedge=False):
+        results = {}
+        for next_result in self.as_completed(clients, lat, lon, deadline, provider_timeout, hedge):
+            name, result = await next_result
+            results[name] = result
+        return results
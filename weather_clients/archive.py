@@ -0,0 +1,286 @@
+import calendar
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from os import getenv
+
+import numpy as np
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+from . import metrics
+from .weather_apis.utils.forecast_series import CategoricalColumn, ForecastSeries
+
+logger = logging.getLogger(__name__)
+
+NUMERIC = 'numeric'
+CATEGORICAL = 'categorical'
+# Columns every row has, the rest are whichever fields process_data emitted
+KEY_COLUMNS = {'provider': CATEGORICAL, 'model': CATEGORICAL, 'lat': NUMERIC, 'lon': NUMERIC,
+               'fetched_at': NUMERIC, 'valid_time': NUMERIC, 'place_name': CATEGORICAL}
+
+
+def forecast_parts(forecast):
+    """Yields (model, series) for a processed forecast, a series or a dict of them by model"""
+    if isinstance(forecast, ForecastSeries):
+        yield None, forecast
+    elif isinstance(forecast, dict):
+        for model, series in forecast.items():
+            if isinstance(series, ForecastSeries):
+                yield model, series
+
+
+def build_columns(batch):
+    """
+    Turns a batch of (provider, lat, lon, fetched_at, forecast) into one array
+    per column and their kinds. Categorical columns are uint16 codes into a list
+    of categories shared by the whole batch, code 0 being None. Rows missing a
+    field, or with it as the other kind to the rest of the batch, get NaN / None.
+    """
+    parts = []
+    kinds = dict(KEY_COLUMNS)
+    for provider, lat, lon, fetched_at, forecast in batch:
+        for model, series in forecast_parts(forecast):
+            if len(series):
+                parts.append((provider, model, lat, lon, fetched_at, series))
+                for name, column in series.columns.items():
+                    kinds.setdefault(name, CATEGORICAL if isinstance(column, CategoricalColumn) else NUMERIC)
+
+    columns = {}
+    categories = {}
+    for name, kind in kinds.items():
+        pieces = []
+        if kind == CATEGORICAL:
+            combined = CategoricalColumn()
+            for provider, model, lat, lon, fetched_at, series in parts:
+                column = series.columns.get(name)
+                if isinstance(column, CategoricalColumn):
+                    remap = np.array([combined.code(category) for category in column.categories], dtype=np.uint16)
+                    pieces.append(remap[np.frombuffer(column.codes, dtype=np.uint16)])
+                else:
+                    constant = {'provider': provider, 'model': model, 'place_name': series.place_name}.get(name)
+                    pieces.append(np.full(len(series), combined.code(constant), dtype=np.uint16))
+            categories[name] = combined.categories
+            columns[name] = np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.uint16)
+        else:
+            for provider, model, lat, lon, fetched_at, series in parts:
+                column = series.columns.get(name)
+                if name == 'valid_time':
+                    pieces.append(series.utc_times())
+                elif name in ('lat', 'lon', 'fetched_at'):
+                    pieces.append(np.full(len(series), {'lat': lat, 'lon': lon, 'fetched_at': fetched_at}[name]))
+                elif column is not None and not isinstance(column, CategoricalColumn):
+                    pieces.append(column.to_numpy())
+                else:
+                    pieces.append(np.full(len(series), np.nan))
+            columns[name] = np.concatenate(pieces) if pieces else np.zeros(0)
+    return columns, kinds, categories
+
+
+class ForecastArchive:
+    """
+    Append-only store of every forecast fetched from a provider, for analysis.
+    Forecasts are buffered in memory and written in batches on a worker thread
+    every flush_seconds, or sooner past batch_rows time steps. Each batch is a
+    segment, a directory holding one .npy file per column and a meta.json with
+    its categories and the providers, locations and valid times it covers,
+    inside a directory for the UTC day it was written on. Segments are renamed
+    into place once complete and never changed, so readers in other processes
+    only ever see whole ones, and scan() memory maps just the columns it needs
+    from the segments whose meta can match.
+
+    Set ARCHIVE_DIR (archive by default), ARCHIVE_FLUSH_SECONDS and
+    ARCHIVE_BATCH_ROWS, or ARCHIVE=0 to stop recording. The meta of the
+    ARCHIVE_META_CACHE_SIZE most recently scanned segments is kept in memory.
+    ARCHIVE_MAX_HORIZON_DAYS is the furthest ahead any provider forecasts,
+    scans skip the days written too long before the range they ask for.
+    """
+
+    def __init__(self, path=None, flush_seconds=None, batch_rows=None, enabled=None, meta_cache_size=None,
+                 max_horizon_days=None):
+        self.path = path or getenv("ARCHIVE_DIR", "archive")
+        self.flush_seconds = float(flush_seconds or getenv("ARCHIVE_FLUSH_SECONDS", 300))
+        self.batch_rows = int(batch_rows or getenv("ARCHIVE_BATCH_ROWS", 100000))
+        self.enabled = enabled if enabled is not None else getenv("ARCHIVE", "1") != "0"
+        self._pending = []
+        self._pending_rows = 0
+        self._callback = None
+        self._sequence = 0
+        # Segments never change once written, so their meta can be kept, least recently used first out
+        self.meta_cache_size = int(meta_cache_size or getenv("ARCHIVE_META_CACHE_SIZE", 10000))
+        self._meta = OrderedDict()
+        self.max_horizon_days = float(max_horizon_days or getenv("ARCHIVE_MAX_HORIZON_DAYS", 16))
+
+    def start(self):
+        if self.enabled:
+            self._callback = PeriodicCallback(self.flush, self.flush_seconds * 1000)
+            self._callback.start()
+
+    def stop(self):
+        if self._callback is not None:
+            self._callback.stop()
+            self._callback = None
+
+    def append(self, key, forecast):
+        """Queues a processed forecast for the (provider, lat, lon) cache key, a no-op until start()"""
+        if self._callback is None:
+            return
+        provider, lat, lon = key
+        self._pending.append((provider, lat, lon, time.time(), forecast))
+        self._pending_rows += sum(len(series) for _, series in forecast_parts(forecast))
+        if self._pending_rows >= self.batch_rows:
+            IOLoop.current().add_callback(self.flush)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending, self._pending_rows = self._pending, [], 0
+        self._sequence += 1
+        name = f"{int(time.time() * 1000)}-{os.getpid()}-{self._sequence}"
+        try:
+            await IOLoop.current().run_in_executor(None, self.write_segment, batch, name)
+        except Exception:
+            logger.exception("Couldn't archive %s forecasts", len(batch))
+
+    def write_segment(self, batch, name):
+        columns, kinds, categories = build_columns(batch)
+        rows = len(columns['valid_time'])
+        if not rows:
+            return None
+        day = time.strftime('%Y-%m-%d', time.gmtime(batch[0][3]))
+        final = os.path.join(self.path, day, name)
+        staging = os.path.join(self.path, day, '.' + name)
+        os.makedirs(staging)
+        for column, values in columns.items():
+            np.save(os.path.join(staging, column + '.npy'), values)
+        meta = {
+            'rows': rows,
+            'columns': {column: {'kind': kind, 'categories': categories.get(column)}
+                        for column, kind in kinds.items()},
+            'providers': sorted(set(batch_provider for batch_provider, *_ in batch)),
+            'valid_time': [float(columns['valid_time'].min()), float(columns['valid_time'].max())],
+            'lat': [float(columns['lat'].min()), float(columns['lat'].max())],
+            'lon': [float(columns['lon'].min()), float(columns['lon'].max())],
+        }
+        with open(os.path.join(staging, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        os.rename(staging, final)
+        metrics.archive_rows.inc(rows)
+        return final
+
+    def day_could_hold(self, day, start=None, end=None):
+        """
+        Whether segments written on day can have time steps valid from start up
+        to end. They're fetched during the day, forecast at most max_horizon_days
+        ahead, and given a day's leeway either side for the past hours some
+        providers include and for batches flushed after midnight.
+        """
+        try:
+            day_start = calendar.timegm(time.strptime(day, '%Y-%m-%d'))
+        except ValueError:
+            return True
+        if end is not None and day_start >= end + 86400:
+            return False
+        if start is not None and day_start + (2 + self.max_horizon_days) * 86400 < start:
+            return False
+        return True
+
+    def segments(self, start=None, end=None):
+        """
+        Yields (path, meta) for every complete segment, oldest day first, or
+        only those from the days that could have time steps valid from start
+        up to end, without reading the meta of the rest.
+        """
+        if not os.path.isdir(self.path):
+            return
+        for day in sorted(os.listdir(self.path)):
+            day_path = os.path.join(self.path, day)
+            if not os.path.isdir(day_path) or not self.day_could_hold(day, start, end):
+                continue
+            for name in sorted(os.listdir(day_path)):
+                if name.startswith('.'):
+                    continue
+                segment = os.path.join(day_path, name)
+                yield segment, self.meta(segment)
+
+    def meta(self, segment):
+        meta = self._meta.get(segment)
+        if meta is None:
+            with open(os.path.join(segment, 'meta.json')) as f:
+                meta = self._meta[segment] = json.load(f)
+            while len(self._meta) > self.meta_cache_size:
+                self._meta.popitem(last=False)
+        else:
+            self._meta.move_to_end(segment)
+        return meta
+
+    def column_names(self):
+        """Every column in any segment"""
+        return {column for _, meta in self.segments() for column in meta['columns']}
+
+    def scan(self, provider=None, lat=None, lon=None, start=None, end=None, columns=None):
+        """
+        Returns {column: array} of the archived time steps for provider, at lat /
+        lon to 2dp as in the forecast cache, valid from start up to end (seconds
+        since the epoch), each optional. Categorical columns come back as object
+        arrays. columns limits which are read, by default all of them.
+        """
+        if lat is not None:
+            lat = round(float(lat), 2)
+        if lon is not None:
+            lon = round(float(lon), 2)
+        results = []
+        kinds = {}
+        for segment, meta in self.segments(start, end):
+            if provider is not None and provider not in meta['providers']:
+                continue
+            if lat is not None and not meta['lat'][0] <= lat <= meta['lat'][1]:
+                continue
+            if lon is not None and not meta['lon'][0] <= lon <= meta['lon'][1]:
+                continue
+            if start is not None and meta['valid_time'][1] < start:
+                continue
+            if end is not None and meta['valid_time'][0] >= end:
+                continue
+
+            def load(column):
+                return np.load(os.path.join(segment, column + '.npy'), mmap_mode='r')
+
+            mask = np.ones(meta['rows'], dtype=bool)
+            if provider is not None:
+                mask &= load('provider') == meta['columns']['provider']['categories'].index(provider)
+            if lat is not None:
+                mask &= load('lat') == lat
+            if lon is not None:
+                mask &= load('lon') == lon
+            if start is not None or end is not None:
+                valid_time = load('valid_time')
+                if start is not None:
+                    mask &= valid_time >= start
+                if end is not None:
+                    mask &= valid_time < end
+            rows = np.flatnonzero(mask)
+            if not len(rows):
+                continue
+            selected = {}
+            for column, info in meta['columns'].items():
+                if columns is not None and column not in columns:
+                    continue
+                kinds.setdefault(column, info['kind'])
+                values = load(column)[rows]
+                if info['kind'] == CATEGORICAL:
+                    values = np.asarray(info['categories'], dtype=object)[values]
+                selected[column] = values
+            results.append((len(rows), selected))
+
+        output = {}
+        for column, kind in kinds.items():
+            output[column] = np.concatenate([
+                selected[column] if column in selected else
+                np.full(count, None if kind == CATEGORICAL else np.nan, dtype=object if kind == CATEGORICAL else None)
+                for count, selected in results])
+        return output
+
+
+archive = ForecastArchive()
@@ -0,0 +1,46 @@
+"""
+Writes archived forecasts matching the filters to stdout as CSV:
+
+    python -m weather_clients.archive_csv --provider MetOfficeClient --lat 50.74 --lon -2.9 --start 2024-05-01
+"""
+import argparse
+import csv
+import sys
+from datetime import datetime, timezone
+
+from .archive import archive
+
+
+def parse_time(value):
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--provider', help="Client class name, e.g. MetOfficeClient")
+    parser.add_argument('--lat', type=float)
+    parser.add_argument('--lon', type=float)
+    parser.add_argument('--start', type=parse_time, help="ISO date or time valid from, UTC unless given")
+    parser.add_argument('--end', type=parse_time, help="ISO date or time valid until, UTC unless given")
+    parser.add_argument('--columns', help="Comma separated columns to output in that order, all by default")
+    args = parser.parse_args(argv)
+
+    columns = [column.strip() for column in args.columns.split(',')] if args.columns else None
+    if columns:
+        known = archive.column_names()
+        unknown = [column for column in columns if column not in known]
+        if unknown:
+            parser.error("unknown columns: %s" % ', '.join(unknown))
+    data = archive.scan(args.provider, args.lat, args.lon, args.start, args.end, columns)
+    writer = csv.writer(sys.stdout)
+    names = columns or list(data)
+    writer.writerow(names)
+    for row in zip(*(data.get(name, ()) for name in names)):
+        writer.writerow(['' if value is None or value != value else value for value in row])
+
+
+if __name__ == '__main__':
+    main()
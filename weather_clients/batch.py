@@ -0,0 +1,85 @@
+import asyncio
+
+from tornado.locks import Semaphore
+
+
+class BatchForecaster:
+    """
+    Gets forecasts for many points from many clients at once. Points are
+    grouped per provider by the location they really resolve to (e.g. the same
+    Met Office site or AccuWeather location key) so each location is only
+    fetched once, and each provider has at most max_concurrency requests in
+    flight. Results are yielded per provider and location as they complete.
+    """
+
+    def __init__(self, forecast_cache):
+        self.forecast_cache = forecast_cache
+        self._limits = {}
+
+    def limit(self, client):
+        name = client.__class__.__name__
+        if name not in self._limits:
+            self._limits[name] = Semaphore(client.max_concurrency)
+        return self._limits[name]
+
+    async def group_points(self, client, points):
+        """Returns {location_key: [point indexes]} and {point index: error} for one client"""
+        # Points that round to the same place only need resolving once
+        by_coords = {}
+        for index, (lat, lon) in points.items():
+            by_coords.setdefault(self.forecast_cache.normalise(lat, lon), []).append(index)
+
+        async def resolve(coords):
+            async with self.limit(client):
+                return await client.location_key(*coords)
+
+        keys = await asyncio.gather(*[resolve(coords) for coords in by_coords], return_exceptions=True)
+        groups, errors = {}, {}
+        for indexes, key in zip(by_coords.values(), keys):
+            if isinstance(key, Exception):
+                errors.update({index: key for index in indexes})
+            else:
+                groups.setdefault(key, []).extend(indexes)
+        return groups, errors
+
+    async def fetch_group(self, client, location_key, indexes, points):
+        lat, lon = points[indexes[0]]
+        result = {'provider': client.__class__.__name__, 'location_key': location_key, 'points': indexes}
+        try:
+            async with self.limit(client):
+                result['data'] = await self.forecast_cache.get_forecast_lat_lon(client, lat, lon)
+            result['status'] = 'ok'
+        except Exception as e:
+            result.update(status='error', error=str(e) or e.__class__.__name__)
+        return result
+
+    async def run_client(self, client, points, queue):
+        try:
+            groups, errors = await self.group_points(client, points)
+            for index, error in errors.items():
+                await queue.put({'provider': client.__class__.__name__, 'points': [index],
+                                 'status': 'error', 'error': str(error) or error.__class__.__name__})
+            for next_result in asyncio.as_completed([
+                    self.fetch_group(client, key, indexes, points) for key, indexes in groups.items()]):
+                await queue.put(await next_result)
+        finally:
+            await queue.put(None)
+
+    async def forecasts(self, clients, points):
+        """
+        Async generator of result dicts, one per provider and distinct location.
+        points is {index: (lat, lon)}, each result lists the point indexes it covers.
+        """
+        queue = asyncio.Queue()
+        tasks = [asyncio.ensure_future(self.run_client(client, points, queue)) for client in clients]
+        remaining = len(tasks)
+        try:
+            while remaining:
+                result = await queue.get()
+                if result is None:
+                    remaining -= 1
+                else:
+                    yield result
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,187 @@
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from os import getenv
+
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+logger = logging.getLogger(__name__)
+
+
+class DiskCache:
+    """
+    Key / value cache kept in a sqlite file so entries survive restarts and
+    can be shared by several processes on the same host (the database runs in
+    WAL mode so readers don't block the writer). Each entry records when it
+    was fetched and when it expires, expired entries are dropped when read
+    and cleared out in bulk by compact(). get_async() and set_async() run the
+    same on a worker thread, for values big enough that pickling them or
+    waiting on another process's write lock would stall the IOLoop.
+    """
+
+    def __init__(self, name, default_ttl=None):
+        self.name = name
+        self.default_ttl = default_ttl
+        # One connection per thread, sqlite connections can't be shared between them
+        self._local = threading.local()
+        all_caches.append(self)
+
+    @property
+    def path(self):
+        cache_dir = getenv("CACHE_DIR", ".cache")
+        return os.path.join(cache_dir, f"{self.name}.sqlite")
+
+    def connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=5)
+        # Only takes effect on a new database, see enable_incremental_vacuum()
+        connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, fetched_at REAL, expires_at REAL)")
+        # Caches created before fetched_at was recorded
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(cache)")]
+        if 'fetched_at' not in columns:
+            connection.execute("ALTER TABLE cache ADD COLUMN fetched_at REAL")
+        return connection
+
+    @property
+    def connection(self):
+        # sqlite connections can't be shared across a fork either, so reconnect in each process
+        local = self._local
+        if getattr(local, 'connection', None) is None or local.pid != os.getpid():
+            local.connection = self.connect()
+            local.pid = os.getpid()
+        return local.connection
+
+    def get_entry(self, key):
+        """Returns (value, fetched_at, expires_at) or None if missing or expired"""
+        row = self.connection.execute(
+            "SELECT value, fetched_at, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, fetched_at, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            self.delete(key)
+            return None
+        return pickle.loads(value), fetched_at, expires_at
+
+    def get(self, key, default=None):
+        entry = self.get_entry(key)
+        return default if entry is None else entry[0]
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.default_ttl
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, fetched_at, expires_at) VALUES (?, ?, ?, ?)",
+                (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), now, expires_at))
+
+    async def get_async(self, key, default=None):
+        return await IOLoop.current().run_in_executor(None, self.get, key, default)
+
+    def set_async(self, key, value, ttl=None):
+        """Writes the entry on a worker thread without waiting for it, failures are logged"""
+        future = IOLoop.current().run_in_executor(None, self.set, key, value, ttl)
+        future.add_done_callback(self._log_failure)
+        return future
+
+    def _log_failure(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning("Couldn't write to %s: %s", self.name, future.exception())
+
+    def increment(self, key, amount=1, ttl=None, limit=None):
+        """
+        Atomically adds amount to a numeric entry, across processes too, and
+        returns the new value. With a limit, returns None and leaves the entry
+        alone instead if the new value would be over it.
+        """
+        ttl = ttl if ttl is not None else self.default_ttl
+        now = time.time()
+        with self.connection:
+            # Take the write lock before reading so two processes can't both read the old value
+            self.connection.execute("BEGIN IMMEDIATE")
+            row = self.connection.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            value = amount
+            if row is not None and (row[1] is None or row[1] >= now):
+                value += pickle.loads(row[0])
+            if limit is not None and value > limit:
+                return None
+            self.connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, fetched_at, expires_at) VALUES (?, ?, ?, ?)",
+                (key, pickle.dumps(value), now, now + ttl if ttl is not None else None))
+        return value
+
+    def delete(self, key):
+        with self.connection:
+            self.connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def compact(self):
+        """Deletes expired entries and returns the space, safe to run from another thread"""
+        connection = self.connect()
+        try:
+            with connection:
+                connection.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+            connection.execute("PRAGMA incremental_vacuum")
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            connection.close()
+
+    def enable_incremental_vacuum(self):
+        """
+        Rebuilds a cache made before auto_vacuum was set so compact() can return
+        space. That can't be done in WAL mode, and leaving it needs the only
+        connection to the database, so run it before anything else opens it.
+        """
+        connection = self.connect()
+        try:
+            if connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                return
+            logger.info("Rebuilding %s with incremental vacuum", self.name)
+            connection.execute("PRAGMA journal_mode = DELETE")
+            connection.execute("VACUUM")
+            connection.execute("PRAGMA journal_mode = WAL")
+        finally:
+            connection.close()
+
+
+all_caches = []
+
+
+def compact_all():
+    for cache in all_caches:
+        try:
+            cache.compact()
+        except sqlite3.Error as e:
+            logger.warning("Couldn't compact %s: %s", cache.name, e)
+
+
+def enable_incremental_vacuum_all():
+    for cache in all_caches:
+        try:
+            cache.enable_incremental_vacuum()
+        except sqlite3.Error as e:
+            logger.warning("Couldn't rebuild %s: %s", cache.name, e)
+
+
+def start_compaction(interval_seconds=15 * 60):
+    """Periodically compacts every cache on a worker thread so the IOLoop isn't blocked"""
+    callback = PeriodicCallback(
+        lambda: IOLoop.current().run_in_executor(None, compact_all), interval_seconds * 1000)
+    callback.start()
+    return callback
+
+
+# Lookups from a place to a provider's location id, these change rarely
+location_cache = DiskCache("locations", default_ttl=30 * 24 * 3600)
+# Raw response bodies from the providers, keyed by provider and url
+response_cache = DiskCache("responses")
+# Processed forecasts, a second tier behind the in memory ForecastCache
+forecast_store = DiskCache("forecasts")
@@ -0,0 +1,106 @@
+import warnings
+from datetime import datetime, timezone
+
+import numpy as np
+
+from .weather_apis.utils.definitions import no_data_value
+from .weather_apis.utils.forecast_series import ForecastSeries
+
+HOUR = 3600
+
+# Fields combined across providers, already in canonical units, see utils.normalization
+ENSEMBLE_FIELDS = (
+    'temperature_celcius',
+    'feels_like_temperature_celcius',
+    'wind_speed_kph',
+    'wind_gust_kph',
+    'relative_humidity_percentage',
+    'precipitation_probability_percentage',
+)
+
+
+def flatten_forecasts(forecasts):
+    """Turns {client: series or {model: series}} into {name: series}"""
+    flat = {}
+    for name, forecast in forecasts.items():
+        if isinstance(forecast, ForecastSeries):
+            flat[name] = forecast
+        elif isinstance(forecast, dict):
+            for model, series in forecast.items():
+                if isinstance(series, ForecastSeries):
+                    flat[f"{name}.{model}"] = series
+    return flat
+
+
+def series_field(series, field):
+    """Returns the values of field as floats with missing data as NaN, or None if the provider doesn't have it"""
+    if field not in series.columns:
+        return None
+    values = np.array(series.column(field), dtype=np.float64)
+    values[values == no_data_value] = np.nan
+    return values
+
+
+def align(times, values, grid, max_gap=3 * HOUR):
+    """
+    Linearly interpolates values onto grid, leaving NaN outside the provider's
+    coverage or where its samples are more than max_gap seconds apart.
+    """
+    valid = ~np.isnan(values)
+    times, values = times[valid], values[valid]
+    if len(times) == 0:
+        return np.full(len(grid), np.nan)
+    order = np.argsort(times)
+    times, values = times[order], values[order]
+    aligned = np.interp(grid, times, values, left=np.nan, right=np.nan)
+    right = np.clip(np.searchsorted(times, grid), 0, len(times) - 1)
+    left = np.clip(right - 1, 0, len(times) - 1)
+    exact = times[right] == grid
+    aligned[~exact & (times[right] - times[left] > max_gap)] = np.nan
+    return aligned
+
+
+def to_list(values, decimals=2):
+    return [None if np.isnan(value) else value for value in np.round(values, decimals).tolist()]
+
+
+def build_ensemble(forecasts, max_hours=240):
+    """
+    Combines forecasts from many providers into one. Every provider is put on a
+    common hourly UTC timeline, then the mean, median, min, max, spread
+    (standard deviation) and provider count are worked out per field and hour.
+    """
+    series_by_name = {name: series for name, series in flatten_forecasts(forecasts).items() if len(series)}
+    if not series_by_name:
+        return {'providers': [], 'date_time': [], 'fields': {}}
+    utc_times = {name: series.utc_times() for name, series in series_by_name.items()}
+    start = np.floor(min(times.min() for times in utc_times.values()) / HOUR) * HOUR
+    end = np.ceil(max(times.max() for times in utc_times.values()) / HOUR) * HOUR
+    grid = np.arange(start, min(end, start + max_hours * HOUR) + 1, HOUR)
+
+    fields = {}
+    for field in ENSEMBLE_FIELDS:
+        rows = []
+        for name, series in series_by_name.items():
+            values = series_field(series, field)
+            if values is not None:
+                rows.append(align(utc_times[name], values, grid))
+        if not rows:
+            continue
+        stacked = np.vstack(rows)
+        with warnings.catch_warnings():
+            # Hours no provider covers are all NaN, which is what we want in the output
+            warnings.simplefilter('ignore', RuntimeWarning)
+            fields[field] = {
+                'mean': to_list(np.nanmean(stacked, axis=0)),
+                'median': to_list(np.nanmedian(stacked, axis=0)),
+                'min': to_list(np.nanmin(stacked, axis=0)),
+                'max': to_list(np.nanmax(stacked, axis=0)),
+                'spread': to_list(np.nanstd(stacked, axis=0)),
+                'count': np.count_nonzero(~np.isnan(stacked), axis=0).tolist(),
+            }
+    return {
+        'providers': sorted(series_by_name),
+        'date_time': [datetime.fromtimestamp(timestamp, timezone.utc) for timestamp in grid.tolist()],
+        'fields': fields,
+    }
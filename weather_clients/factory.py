@@ -1,10 +1,27 @@
 from inspect import getmembers, isclass, isabstract
+from tornado import gen
 from weather_clients import weather_apis
+from .aggregator import Aggregator
+from .batch import BatchForecaster
+from .forecast_cache import ForecastCache
+from .geocoding import city_geocoder, postcode_geocoder
+from .prefetch import Prefetcher
 
 
 class Factory:
+    """
+    Application scoped registry of weather clients. Each client is constructed
+    once and shared between requests, call warm() at startup to do any slow
+    setup (e.g. loading the Met Office sitelist) before serving traffic.
+    """
+
     def __init__(self) -> None:
         self._members = self.load_members()
+        self._instances = {}
+        self.forecast_cache = ForecastCache()
+        self.aggregator = Aggregator(self.forecast_cache)
+        self.batch = BatchForecaster(self.forecast_cache)
+        self.prefetcher = Prefetcher(self.forecast_cache)
 
     def load_members(self):
         output = {}
@@ -13,6 +30,23 @@ class Factory:
                 output[name.lower()] = cls
         return output
 
+    def get_all_members(self):
+        return [self.get_member(name) for name in self._members]
+
+    def get_member(self, api_name: str):
+        name = api_name.lower()
+        if name not in self._instances:
+            self._instances[name] = self._members[name]()
+        return self._instances[name]
+
+    async def warm(self):
+        await gen.multi([client.warm() for client in self.get_all_members()] +
+                        [postcode_geocoder.preload(), city_geocoder.gazetteer.preload()])
+
+    async def prefill(self):
+        """Fills the shared on-disk caches once, so forked workers don't each fetch them"""
+        await gen.multi([client.prefill() for client in self.get_all_members()])
+
     def instantiate_all_members(self):
         return [cls() for name, cls in self._members.items()]
 
@@ -0,0 +1,165 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from os import getenv
+
+from . import metrics, tracing
+from .archive import archive
+from .disk_cache import forecast_store
+from .rate_limit import QuotaExceeded
+
+
+class LatencyTracker:
+    """
+    Keeps the most recent successful upstream fetch latencies per provider,
+    percentiles need min_samples (HEDGE_MIN_SAMPLES, 20 by default) of them
+    """
+
+    def __init__(self, size=200, min_samples=None):
+        self.size = size
+        self.min_samples = int(min_samples or getenv("HEDGE_MIN_SAMPLES", 20))
+        self._samples = {}
+
+    def record(self, provider, seconds):
+        if provider not in self._samples:
+            self._samples[provider] = deque(maxlen=self.size)
+        self._samples[provider].append(seconds)
+
+    def percentile(self, provider, percentile):
+        samples = self._samples.get(provider)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+class CacheEntry:
+    __slots__ = ('value', 'expires_at', 'client', 'accesses')
+
+    def __init__(self, value, expires_at, client=None):
+        self.value = value
+        self.expires_at = expires_at
+        self.client = client
+        # Hits since the entry was last fetched, used to pick entries worth refreshing early
+        self.accesses = 0
+
+
+class ForecastCache:
+    """
+    In memory cache of processed forecasts keyed by provider and lat / lon
+    rounded to 2dp (~1km). Entries expire after the client's cache_ttl and the
+    least recently used entries are evicted past max_entries. Concurrent
+    misses for the same key share a single upstream request.
+
+    Misses fall back to the on disk forecast_store before going upstream, so
+    a restart or another worker process doesn't have to re-fetch. When a
+    provider is out of quota an expired entry is served if there is one.
+    Everything fetched from upstream is also kept in the archive.
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = int(max_entries or getenv("FORECAST_CACHE_SIZE", 10000))
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        # Only real upstream fetches, hits would drag the percentiles hedging relies on to zero
+        self.latencies = LatencyTracker()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def normalise(lat, lon):
+        return round(float(lat), 2), round(float(lon), 2)
+
+    def make_key(self, client, lat, lon):
+        return (client.__class__.__name__, *self.normalise(lat, lon))
+
+    def entries(self):
+        return list(self._entries.items())
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at < time.time():
+            return None
+        self._entries.move_to_end(key)
+        entry.accesses += 1
+        return entry.value
+
+    def set(self, key, value, ttl, expires_at=None, client=None):
+        self._entries[key] = CacheEntry(value, expires_at or time.time() + ttl, client)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_forecast_lat_lon(self, client, lat, lon):
+        key = self.make_key(client, lat, lon)
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            metrics.cache_requests.labels('forecast', 'hit').inc()
+            return value
+        self.misses += 1
+        metrics.cache_requests.labels('forecast', 'miss').inc()
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(key, client, *key[1:]))
+            self._in_flight[key] = future
+        # Shield so a cancelled waiter doesn't cancel the fetch for everyone else
+        return await asyncio.shield(future)
+
+    def fetches_in_flight(self):
+        return len(self._in_flight)
+
+    @staticmethod
+    def store_key(key):
+        return "%s:%s,%s" % key
+
+    async def refresh(self, key, client):
+        """
+        Fetches key from upstream again even though it hasn't expired yet, unless
+        another process sharing the forecast store has already done so
+        """
+        current = self._entries.get(key)
+        stored = forecast_store.get_entry(self.store_key(key))
+        if current is not None and stored is not None and stored[2] > current.expires_at:
+            value, _, expires_at = stored
+            self.set(key, value, client.cache_ttl, expires_at=expires_at, client=client)
+            return value
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(key, client, *key[1:], use_store=False))
+            self._in_flight[key] = future
+        return await asyncio.shield(future)
+
+    async def _fetch(self, key, client, lat, lon, use_store=True):
+        with tracing.span('forecast', provider=key[0]) as forecast_span:
+            return await self._fetch_forecast(key, client, lat, lon, use_store, forecast_span)
+
+    async def _fetch_forecast(self, key, client, lat, lon, use_store, forecast_span):
+        try:
+            store_key = self.store_key(key)
+            entry = forecast_store.get_entry(store_key) if use_store else None
+            if use_store:
+                metrics.cache_requests.labels('forecast_store', 'miss' if entry is None else 'hit').inc()
+            if entry is not None:
+                forecast_span.set('store', 'hit')
+                value, _, expires_at = entry
+                self.set(key, value, client.cache_ttl, expires_at=expires_at, client=client)
+                return value
+            try:
+                start = time.monotonic()
+                value = await client.get_forecast_lat_lon(lat=lat, lon=lon)
+                self.latencies.record(key[0], time.monotonic() - start)
+            except QuotaExceeded:
+                stale = self._entries.get(key)
+                if stale is None:
+                    raise
+                return stale.value
+            self.set(key, value, client.cache_ttl, client=client)
+            forecast_store.set(store_key, value, ttl=client.cache_ttl)
+            archive.append(key, value)
+            return value
+        finally:
+            del self._in_flight[key]
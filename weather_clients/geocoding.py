@@ -0,0 +1,275 @@
+import asyncio
+import os
+import time
+import unicodedata
+from collections import OrderedDict
+from os import getenv
+
+import pgeocode
+from geopy.geocoders import Nominatim
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.locks import Lock
+
+from . import tracing
+from .disk_cache import location_cache
+
+# Countries whose postcode data only has the outward code (the part before the space)
+OUTWARD_CODE_COUNTRIES = {'GB', 'IE', 'CA'}
+
+DEFAULT_GAZETTEER_PATH = os.path.join(os.path.dirname(__file__), 'data', 'cities.tsv')
+# Common ways of writing a country that aren't its ISO code
+COUNTRY_ALIASES = {
+    'uk': 'GB', 'united kingdom': 'GB', 'great britain': 'GB', 'britain': 'GB',
+    'england': 'GB', 'scotland': 'GB', 'wales': 'GB', 'northern ireland': 'GB',
+    'ireland': 'IE', 'france': 'FR', 'germany': 'DE', 'spain': 'ES', 'italy': 'IT',
+    'netherlands': 'NL', 'holland': 'NL', 'belgium': 'BE', 'portugal': 'PT',
+    'usa': 'US', 'united states': 'US', 'united states of america': 'US', 'america': 'US',
+    'canada': 'CA', 'australia': 'AU', 'new zealand': 'NZ', 'japan': 'JP',
+}
+
+
+class PostcodeGeocoder:
+    """
+    Postcode to lat / lon lookups from the pgeocode (GeoNames) datasets. Each
+    country's dataset is read once, on a worker thread as it may have to be
+    downloaded, into a dict keyed by normalised postcode. Concurrent lookups
+    for a country that isn't loaded share one load, and at most max_countries
+    are kept in memory, least recently used first out.
+    """
+
+    def __init__(self, max_countries=None):
+        self.max_countries = int(max_countries or getenv("POSTCODE_MAX_COUNTRIES", 4))
+        self._indexes = OrderedDict()
+        self._loading = {}
+
+    @staticmethod
+    def normalise(country_code, postcode):
+        postcode = str(postcode).strip().upper()
+        if country_code in OUTWARD_CODE_COUNTRIES:
+            parts = postcode.split()
+            if len(parts) > 1:
+                return parts[0]
+            # Full UK postcode typed without a space, the inward code is always 3 characters
+            if country_code == 'GB' and len(postcode) > 4:
+                return postcode[:-3]
+        return postcode
+
+    @staticmethod
+    def validate(country_code):
+        country_code = country_code.upper()
+        if country_code not in pgeocode.COUNTRIES_VALID:
+            raise ValueError("Country code must be one of: " +
+                             ', '.join(pgeocode.COUNTRIES_VALID))
+        return country_code
+
+    @staticmethod
+    def load(country_code):
+        """Reads (downloading on first use) a country's dataset into {postcode: (lat, lon)}, slow"""
+        data = pgeocode.Nominatim(country_code)._data_frame.dropna(subset=['latitude', 'longitude'])
+        return {postcode: (float(lat), float(lon)) for postcode, lat, lon in
+                zip(data['postal_code'].str.upper(), data['latitude'], data['longitude'])}
+
+    def add_index(self, country_code, index):
+        self._indexes[country_code] = index
+        self._indexes.move_to_end(country_code)
+        while len(self._indexes) > self.max_countries:
+            self._indexes.popitem(last=False)
+
+    async def index(self, country_code):
+        country_code = self.validate(country_code)
+        index = self._indexes.get(country_code)
+        if index is not None:
+            self._indexes.move_to_end(country_code)
+            return index
+        future = self._loading.get(country_code)
+        if future is None:
+            future = self._loading[country_code] = asyncio.ensure_future(self._load(country_code))
+        # Shield so a cancelled waiter doesn't cancel the load for everyone else
+        return await asyncio.shield(future)
+
+    async def _load(self, country_code):
+        try:
+            index = await IOLoop.current().run_in_executor(None, self.load, country_code)
+            self.add_index(country_code, index)
+            return index
+        finally:
+            del self._loading[country_code]
+
+    async def lookup(self, country_code, postcode):
+        """Returns the lat and lon of the postcode, raising ValueError if it isn't known"""
+        country_code = self.validate(country_code)
+        with tracing.span('geocode_postcode', country=country_code):
+            index = await self.index(country_code)
+        location = index.get(self.normalise(country_code, postcode))
+        if location is None:
+            raise ValueError("Couldn't geocode that postcode.")
+        return location
+
+    async def lookup_many(self, country_code, postcodes):
+        """Returns a list of (lat, lon), or None for postcodes that aren't known"""
+        country_code = self.validate(country_code)
+        index = await self.index(country_code)
+        return [index.get(self.normalise(country_code, postcode)) for postcode in postcodes]
+
+    async def preload(self, country_codes=None):
+        """Loads datasets ahead of the first lookup, by default those in PRELOAD_POSTCODE_COUNTRIES"""
+        if country_codes is None:
+            country_codes = [code for code in getenv("PRELOAD_POSTCODE_COUNTRIES", "").split(',') if code]
+        for country_code in country_codes:
+            await self.index(country_code.strip())
+
+
+postcode_geocoder = PostcodeGeocoder()
+
+
+def normalise_name(name):
+    """Lower case, accents removed and whitespace collapsed, so 'Zürich ' matches 'zurich'"""
+    decomposed = unicodedata.normalize('NFKD', str(name))
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.casefold().split())
+
+
+def normalise_country(country):
+    if not country:
+        return None
+    country = normalise_name(country)
+    return COUNTRY_ALIASES.get(country, country.upper())
+
+
+class Gazetteer:
+    """
+    Offline city name to lat / lon lookups. Reads a tab separated file of
+    either name, country_code, latitude, longitude, population or the GeoNames
+    cities dump format, from GAZETTEER_PATH or the small bundled list.
+
+    Exact lookups are a dict keyed by (name, country), and a prefix trie per
+    country (plus one for all countries) keeps the most populous matches at
+    every node for autocomplete.
+    """
+
+    def __init__(self, path=None, suggestions_per_node=10):
+        self.path = path or getenv("GAZETTEER_PATH", DEFAULT_GAZETTEER_PATH)
+        self.suggestions_per_node = suggestions_per_node
+        self.places = None
+        self._exact = {}
+        self._tries = {}
+
+    @staticmethod
+    def parse_line(line):
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) >= 15:
+            # GeoNames: id, name, asciiname, alternatenames, lat, lon, class, code, country, cc2, admin1-4, population
+            return fields[1], fields[8], float(fields[4]), float(fields[5]), int(fields[14] or 0)
+        name, country_code, lat, lon, population = fields[:5]
+        return name, country_code, float(lat), float(lon), int(population or 0)
+
+    def load(self):
+        places = []
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip() and not line.startswith('#'):
+                    places.append(self.parse_line(line))
+        # Most populous first, so the first place seen for a name or prefix is the one to keep
+        places.sort(key=lambda place: -place[4])
+        exact, tries = {}, {}
+        for index, (name, country_code, _, _, _) in enumerate(places):
+            name = normalise_name(name)
+            exact.setdefault((name, country_code), index)
+            exact.setdefault((name, None), index)
+            for trie_country in (country_code, None):
+                self.add_to_trie(tries.setdefault(trie_country, {}), name, index)
+        # May be on a worker thread, lookups only see it once it's complete
+        self._exact, self._tries = exact, tries
+        self.places = places
+
+    def add_to_trie(self, node, name, index):
+        for char in name:
+            node = node.setdefault(char, {})
+            suggestions = node.setdefault('', [])
+            if len(suggestions) < self.suggestions_per_node:
+                suggestions.append(index)
+
+    def ensure_loaded(self):
+        if self.places is None:
+            self.load()
+
+    async def preload(self):
+        """Parses the gazetteer on a worker thread, rather than in the first request to need it"""
+        if self.places is None:
+            await IOLoop.current().run_in_executor(None, self.ensure_loaded)
+
+    def place(self, index):
+        name, country_code, lat, lon, _ = self.places[index]
+        return {'name': name, 'country_code': country_code, 'lat': lat, 'lon': lon}
+
+    def lookup(self, city, country=None):
+        """Returns (lat, lon) of the most populous place called city, or None"""
+        self.ensure_loaded()
+        index = self._exact.get((normalise_name(city), normalise_country(country)))
+        if index is None:
+            return None
+        _, _, lat, lon, _ = self.places[index]
+        return lat, lon
+
+    def autocomplete(self, prefix, country=None, limit=10):
+        """Returns up to limit places whose name starts with prefix, most populous first"""
+        self.ensure_loaded()
+        node = self._tries.get(normalise_country(country), {})
+        prefix = normalise_name(prefix)
+        if not prefix:
+            return []
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+        return [self.place(index) for index in node[''][:limit]]
+
+
+class CityGeocoder:
+    """
+    Resolves city / country names with the offline gazetteer, falling back to
+    the public Nominatim service for places it doesn't know. Nominatim is
+    called on a worker thread at most once a second, and its answers are
+    cached on disk.
+    """
+
+    def __init__(self, gazetteer=None, min_interval=1.0):
+        self.gazetteer = gazetteer or Gazetteer()
+        self.min_interval = min_interval
+        self._lock = Lock()
+        self._last_request = 0.0
+
+    def nominatim(self, query):
+        location = Nominatim(user_agent="weather_aggregator").geocode(query)
+        return None if location is None else (location.latitude, location.longitude)
+
+    async def geocode(self, city, country):
+        with tracing.span('geocode_city') as geocode_span:
+            return await self._geocode(city, country, geocode_span)
+
+    async def _geocode(self, city, country, geocode_span):
+        location = self.gazetteer.lookup(city, country)
+        if location is not None:
+            geocode_span.set('source', 'gazetteer')
+            return location
+        geocode_span.set('source', 'nominatim')
+        query = f"{city}, {country}"
+        cache_key = f"nominatim:{normalise_name(query)}"
+        location = location_cache.get(cache_key)
+        if location is None:
+            async with self._lock:
+                wait = self._last_request + self.min_interval - time.monotonic()
+                if wait > 0:
+                    await gen.sleep(wait)
+                try:
+                    location = await IOLoop.current().run_in_executor(None, self.nominatim, query)
+                finally:
+                    self._last_request = time.monotonic()
+            if location is None:
+                raise ValueError("Couldn't geocode that place.")
+            location_cache.set(cache_key, location)
+        return location
+
+
+city_geocoder = CityGeocoder()
@@ -0,0 +1,190 @@
+from bisect import bisect_left
+from math import inf
+
+# Upper bounds in seconds, from a cache hit to a provider at its timeout
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                          for name, value in pairs) + '}'
+
+
+def format_value(value):
+    if value == inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Base for metrics that are split by labels. labels(*values) returns the
+    child for one combination of label values, keep hold of it on hot paths
+    so recording is a plain attribute update. Updates happen on the IOLoop
+    thread, the occasional one from a worker thread can race but only ever
+    loses a count.
+    """
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        registry.register(self)
+
+    def make_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self.make_child()
+        return child
+
+    def samples(self):
+        """Yields (suffix, label pairs, value) for every child"""
+        for values, child in sorted(self._children.items()):
+            yield '', self.labelnames, values, (), child.value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, names, values, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{format_labels(names, values, extra)} {format_value(value)}")
+        return lines
+
+
+class CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Counter(Metric):
+    kind = 'counter'
+    make_child = CounterChild
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class GaugeChild(CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+    make_child = GaugeChild
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class HistogramChild:
+    """Counts per bucket, made cumulative only when rendered"""
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def make_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def samples(self):
+        for values, child in sorted(self._children.items()):
+            total = 0
+            for bound, count in zip((*self.buckets, inf), child.counts):
+                total += count
+                yield '_bucket', self.labelnames, values, (('le', format_value(bound)),), total
+            yield '_sum', self.labelnames, values, (), child.sum
+            yield '_count', self.labelnames, values, (), total
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+        return '\n'.join(line for metric in self.metrics for line in metric.render()) + '\n'
+
+
+registry = Registry()
+
+upstream_request_seconds = Histogram(
+    'weather_upstream_request_seconds', "Time for a provider API to respond", ['provider'])
+upstream_response_bytes = Counter(
+    'weather_upstream_response_bytes_total', "Bytes of provider API response bodies received", ['provider'])
+upstream_in_flight = Gauge(
+    'weather_upstream_requests_in_flight', "Provider API requests waiting on a response", ['provider'])
+upstream_errors = Counter(
+    'weather_upstream_errors_total', "Failed provider API requests, by kind (http, timeout or network)",
+    ['provider', 'kind'])
+provider_results = Counter(
+    'weather_provider_results_total', "Outcome of each provider in an aggregated request (ok, timeout, error or skipped)",
+    ['provider', 'status'])
+parse_seconds = Histogram(
+    'weather_parse_seconds', "Time to decode a provider response and run process_data", ['provider'])
+serialize_seconds = Histogram(
+    'weather_serialize_seconds', "Time to encode a response body", ['format'])
+http_request_seconds = Histogram(
+    'weather_http_request_seconds', "Time to handle a request to this app", ['handler', 'method'])
+http_in_flight = Gauge(
+    'weather_http_requests_in_flight', "Requests to this app being handled")
+http_requests = Counter(
+    'weather_http_requests_total', "Requests to this app", ['handler', 'method', 'status'])
+cache_requests = Counter(
+    'weather_cache_requests_total', "Cache lookups by cache and result (hit or miss)", ['cache', 'result'])
+forecast_cache_entries = Gauge(
+    'weather_forecast_cache_entries', "Forecasts held in the in-memory forecast cache")
+archive_rows = Counter(
+    'weather_archive_rows_total', "Forecast time steps written to the archive")
+quota_used = Gauge(
+    'weather_provider_quota_used', "Requests made to a provider today, out of its daily quota", ['provider'])
+
+
+def observe_request(handler):
+    """Records a finished request, called from the application's log_request"""
+    name = type(handler).__name__
+    method = handler.request.method
+    http_request_seconds.labels(name, method).observe(handler.request.request_time())
+    http_requests.labels(name, method, handler.get_status()).inc()
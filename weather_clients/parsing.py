@@ -0,0 +1,78 @@
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from os import getenv
+
+from tornado.ioloop import IOLoop
+
+from . import metrics, tracing
+
+INLINE = 'inline'
+THREAD = 'thread'
+PROCESS = 'process'
+
+
+def decode_and_process(client_class, body, args):
+    """
+    Decodes a provider's JSON body and runs its process_data. Module level so a
+    process pool can pickle it; process_data doesn't use instance state, so
+    there's no need to run the client's __init__ in the worker.
+    """
+    client = client_class.__new__(client_class)
+    return client.process_data(json.loads(body), *args)
+
+
+class Parser:
+    """
+    Runs the CPU heavy part of handling a provider response, decoding the JSON
+    and building the ForecastSeries, either inline on the IOLoop or on a thread
+    or process pool. Bodies smaller than threshold_bytes are always parsed inline
+    as handing them off costs more than parsing them.
+
+    Set with PARSE_EXECUTOR (inline, thread or process), PARSE_WORKERS and
+    PARSE_OFFLOAD_THRESHOLD_BYTES.
+    """
+
+    def __init__(self, mode=None, workers=None, threshold_bytes=None):
+        self.mode = mode or getenv("PARSE_EXECUTOR", INLINE)
+        if self.mode not in (INLINE, THREAD, PROCESS):
+            raise ValueError("PARSE_EXECUTOR must be one of inline, thread or process")
+        self.workers = workers or int(getenv("PARSE_WORKERS", 0)) or None
+        self.threshold_bytes = threshold_bytes if threshold_bytes is not None else int(
+            getenv("PARSE_OFFLOAD_THRESHOLD_BYTES", 64 * 1024))
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            if self.mode == PROCESS:
+                self._executor = ProcessPoolExecutor(self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='parse')
+        return self._executor
+
+    def should_offload(self, body):
+        return self.mode != INLINE and len(body) >= self.threshold_bytes
+
+    async def parse(self, client, body, *args):
+        start = time.perf_counter()
+        provider = type(client).__name__
+        try:
+            if not self.should_offload(body):
+                with tracing.span('decode', provider=provider, bytes=len(body)):
+                    data = json.loads(body)
+                with tracing.span('process_data', provider=provider):
+                    return client.process_data(data, *args)
+            with tracing.span('decode_and_process', provider=provider, bytes=len(body), executor=self.mode):
+                return await IOLoop.current().run_in_executor(
+                    self.executor, decode_and_process, type(client), body, args)
+        finally:
+            metrics.parse_seconds.labels(type(client).__name__).observe(time.perf_counter() - start)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+parser = Parser()
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import random
+import time
+from os import getenv
+
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+from .rate_limit import BACKGROUND, QuotaExceeded, request_priority
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """
+    Refreshes popular forecasts shortly before they expire so that users of
+    hot locations always get a cache hit. Every interval seconds the forecast
+    cache is scanned for entries with at least min_accesses hits that expire
+    within the next lead_time seconds, and a background refresh is scheduled
+    for each at a random point in the jitter window so they don't all hit the
+    providers at once.
+    """
+
+    def __init__(self, forecast_cache, interval=None, lead_time=None, min_accesses=None, jitter=None):
+        self.forecast_cache = forecast_cache
+        self.interval = float(interval or getenv("PREFETCH_INTERVAL", 30))
+        self.lead_time = float(lead_time or getenv("PREFETCH_LEAD_TIME", 120))
+        self.min_accesses = int(min_accesses or getenv("PREFETCH_MIN_ACCESSES", 5))
+        self.jitter = float(jitter or getenv("PREFETCH_JITTER", 60))
+        self._scheduled = set()
+        self._callback = None
+
+    def start(self):
+        self._callback = PeriodicCallback(self.scan, self.interval * 1000)
+        self._callback.start()
+
+    def stop(self):
+        if self._callback is not None:
+            self._callback.stop()
+
+    def scan(self):
+        now = time.time()
+        for key, entry in self.forecast_cache.entries():
+            if key in self._scheduled or entry.client is None or entry.accesses < self.min_accesses:
+                continue
+            expires_in = entry.expires_at - now
+            if expires_in <= 0 or expires_in > self.lead_time + self.interval:
+                continue
+            # Land somewhere in the jitter window before expiry, but never after it
+            earliest = max(0.0, expires_in - self.lead_time)
+            delay = min(earliest + random.uniform(0, self.jitter), expires_in * 0.9)
+            self._scheduled.add(key)
+            IOLoop.current().call_later(delay, self.refresh, key, entry.client)
+
+    def refresh(self, key, client):
+        asyncio.ensure_future(self._refresh(key, client))
+
+    async def _refresh(self, key, client):
+        request_priority.set(BACKGROUND)
+        try:
+            await self.forecast_cache.refresh(key, client)
+        except QuotaExceeded:
+            # Out of background budget, the entry will just expire as normal
+            pass
+        except Exception as e:
+            logger.warning("Couldn't refresh %s: %s", key, e)
+        finally:
+            self._scheduled.discard(key)
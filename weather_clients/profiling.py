@@ -0,0 +1,83 @@
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from tornado import gen
+
+# What cprofile() can sort its report by
+SORT_KEYS = sorted(key.value for key in pstats.SortKey)
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class Profiler:
+    """
+    Profiles the IOLoop thread for a while on request. Either deterministic,
+    with cProfile, or by sampling its stack every interval seconds from a
+    background thread, which costs far less and is safer to leave on under
+    load. Only one profile runs at a time.
+    """
+
+    def __init__(self):
+        self._running = False
+
+    def start(self):
+        if self._running:
+            raise ProfilerBusy("A profile is already running")
+        self._running = True
+
+    async def cprofile(self, seconds, limit=60, sort='cumulative'):
+        """Returns pstats text for everything the IOLoop ran in the next seconds"""
+        self.start()
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            await gen.sleep(seconds)
+        finally:
+            profile.disable()
+            self._running = False
+        output = io.StringIO()
+        pstats.Stats(profile, stream=output).sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+    async def sample(self, seconds, interval=0.005, limit=60):
+        """
+        Returns the IOLoop thread's most common stacks over the next seconds, in
+        the folded "outer;inner count" format flame graph tools read
+        """
+        self.start()
+        stacks = Counter()
+        thread_id = threading.get_ident()
+        stop = threading.Event()
+
+        def sampler():
+            while not stop.wait(interval):
+                frame = sys._current_frames().get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stacks[';'.join(reversed(stack))] += 1
+
+        thread = threading.Thread(target=sampler, name='stack-sampler', daemon=True)
+        started = time.monotonic()
+        try:
+            thread.start()
+            await gen.sleep(seconds)
+        finally:
+            stop.set()
+            self._running = False
+        total = sum(stacks.values())
+        lines = [f"# {total} samples over {time.monotonic() - started:.1f}s every {interval * 1000:g}ms"]
+        lines.extend(f"{stack} {count}" for stack, count in stacks.most_common(limit))
+        return '\n'.join(lines) + '\n'
+
+
+profiler = Profiler()
@@ -0,0 +1,163 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from datetime import date
+from functools import partial
+from heapq import heappop, heappush
+from itertools import count
+
+from tornado.ioloop import IOLoop
+
+from .disk_cache import DiskCache
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Priority of upstream requests made in the current task, background jobs set this to BACKGROUND
+request_priority = ContextVar('request_priority', default=INTERACTIVE)
+
+quota_ledger = DiskCache("quotas", default_ttl=2 * 24 * 3600)
+
+
+class QuotaExceeded(Exception):
+    """Raised instead of calling a provider that is out of budget"""
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or max(1, rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self):
+        self.refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def time_until_token(self):
+        self.refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class ProviderLimiter:
+    """
+    Budget for one provider: a token bucket for the per minute limit and a
+    daily count kept on disk, so it is shared between processes and survives
+    restarts. Waiters for a token are served in priority order, and
+    background requests may only use background_share of the daily quota so
+    there is always some left for interactive requests.
+    """
+
+    def __init__(self, name, requests_per_minute=None, daily_quota=None, background_share=0.8):
+        self.name = name
+        self.bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.daily_quota = daily_quota
+        self.background_share = background_share
+        self._waiters = []
+        self._order = count()
+        self._drain_handle = None
+
+    @property
+    def ledger_key(self):
+        return f"{self.name}:{date.today().isoformat()}"
+
+    def used_today(self):
+        return quota_ledger.get(self.ledger_key, 0)
+
+    def quota(self, priority):
+        return self.daily_quota if priority == INTERACTIVE else int(self.daily_quota * self.background_share)
+
+    async def use_quota(self, priority):
+        """
+        Counts a request against today's quota, or raises QuotaExceeded if it's
+        used up. Checked and counted in one step on the ledger, on a worker thread
+        as it may wait on another process's write lock.
+        """
+        quota = self.quota(priority)
+        used = await IOLoop.current().run_in_executor(
+            None, partial(quota_ledger.increment, self.ledger_key, limit=quota))
+        if used is None:
+            raise QuotaExceeded(f"{self.name} daily quota of {quota} requests used up")
+
+    async def wait_for_token(self, priority, max_wait):
+        if self.bucket is None or (not self._waiters and self.bucket.try_take()):
+            return
+        future = asyncio.get_event_loop().create_future()
+        heappush(self._waiters, (priority, next(self._order), future))
+        self.schedule_drain()
+        try:
+            await asyncio.wait_for(future, max_wait)
+        except asyncio.TimeoutError:
+            raise QuotaExceeded(f"{self.name} rate limited for more than {max_wait}s")
+
+    def schedule_drain(self):
+        if self._drain_handle is None:
+            self._drain_handle = IOLoop.current().call_later(self.bucket.time_until_token(), self.drain)
+
+    def drain(self):
+        self._drain_handle = None
+        while self._waiters:
+            future = self._waiters[0][2]
+            if future.done():
+                # Waiter gave up
+                heappop(self._waiters)
+                continue
+            if not self.bucket.try_take():
+                break
+            heappop(self._waiters)
+            future.set_result(None)
+        if self._waiters:
+            self.schedule_drain()
+
+    async def acquire(self, priority=INTERACTIVE, max_wait=10):
+        await self.wait_for_token(priority, max_wait)
+        # Only once the token is taken, anything checked before then could be stale by now
+        if self.daily_quota is not None:
+            await self.use_quota(priority)
+
+
+class Scheduler:
+    """
+    Holds a ProviderLimiter per client class, built from its requests_per_minute
+    and daily_quota. When serving from several processes each gets an equal
+    share of the per minute limit, the daily quota is already shared on disk.
+    """
+
+    def __init__(self, processes=1):
+        self._limiters = {}
+        self.processes = processes
+
+    def configure(self, processes):
+        """
+        Splits the per minute limits between processes from now on. Drops the
+        limiters made so far, which a forked process mustn't share with its parent.
+        """
+        self.processes = processes
+        self._limiters.clear()
+
+    def limiter(self, client):
+        name = client.__class__.__name__
+        if name not in self._limiters:
+            requests_per_minute = client.requests_per_minute and client.requests_per_minute / self.processes
+            self._limiters[name] = ProviderLimiter(
+                name, requests_per_minute, client.daily_quota)
+        return self._limiters[name]
+
+    async def acquire(self, client, max_wait=10):
+        await self.limiter(client).acquire(request_priority.get(), max_wait)
+
+    def usage(self):
+        return {name: {'used_today': limiter.used_today(), 'daily_quota': limiter.daily_quota}
+                for name, limiter in self._limiters.items()}
+
+
+scheduler = Scheduler()
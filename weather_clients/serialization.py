@@ -0,0 +1,118 @@
+import json
+from datetime import date, datetime
+
+from .weather_apis.utils.forecast_series import ForecastSeries, json_default
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def encode_default(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return json_default(obj)
+
+
+class JSONSerializer:
+    """
+    Compact JSON. Uses orjson when it is installed, which encodes datetimes
+    natively, otherwise the stdlib encoder with ISO 8601 datetimes.
+
+    Dicts and lists are encoded piece by piece so each ForecastSeries is only
+    ever encoded once per format, the bytes are kept on the series and spliced
+    into any later response that contains it (e.g. from the forecast cache).
+    """
+    name = 'json'
+    content_type = 'application/json; charset=UTF-8'
+
+    def dumps(self, obj) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(obj, default=encode_default, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(obj, separators=(',', ':'), default=encode_default).encode()
+
+    def series_payload(self, series):
+        return series.to_rows()
+
+    def encode_series(self, series):
+        encoded = series.encoded.get(self.name)
+        if encoded is None:
+            encoded = series.encoded[self.name] = self.dumps(self.series_payload(series))
+        return encoded
+
+    def encode(self, obj) -> bytes:
+        if isinstance(obj, ForecastSeries):
+            return self.encode_series(obj)
+        if isinstance(obj, dict):
+            return b'{' + b','.join(self.dumps(str(key)) + b':' + self.encode(value)
+                                    for key, value in sorted(obj.items(), key=lambda item: str(item[0]))) + b'}'
+        if isinstance(obj, (list, tuple)):
+            return b'[' + b','.join(self.encode(value) for value in obj) + b']'
+        return self.dumps(obj)
+
+
+class ColumnarJSONSerializer(JSONSerializer):
+    """JSON with one list per field for each forecast rather than one object per hour"""
+    name = 'columnar'
+
+    def series_payload(self, series):
+        return series.to_columns()
+
+
+class PrettyJSONSerializer(JSONSerializer):
+    """Indented, key sorted JSON for reading in a browser"""
+    name = 'pretty'
+
+    def encode(self, obj) -> bytes:
+        return json.dumps(obj, indent=4, sort_keys=True, default=encode_default).encode()
+
+
+class MsgPackSerializer(JSONSerializer):
+    """MessagePack with the same row layout as the JSON, needs the msgpack package"""
+    name = 'msgpack'
+    content_type = 'application/msgpack'
+
+    def __init__(self):
+        self.packer = msgpack.Packer(default=encode_default, datetime=False)
+
+    def dumps(self, obj) -> bytes:
+        return self.packer.pack(obj)
+
+    def encode(self, obj) -> bytes:
+        if isinstance(obj, dict):
+            return self.packer.pack_map_header(len(obj)) + b''.join(
+                self.dumps(str(key)) + self.encode(value) for key, value in obj.items())
+        if isinstance(obj, (list, tuple)):
+            return self.packer.pack_array_header(len(obj)) + b''.join(self.encode(value) for value in obj)
+        return super().encode(obj)
+
+
+SERIALIZERS = {serializer.name: serializer for serializer in
+               [JSONSerializer(), ColumnarJSONSerializer(), PrettyJSONSerializer()]}
+if msgpack is not None:
+    SERIALIZERS['msgpack'] = MsgPackSerializer()
+
+ACCEPT_FORMATS = {
+    'application/msgpack': 'msgpack',
+    'application/x-msgpack': 'msgpack',
+    'application/json': 'json',
+}
+
+
+def choose_serializer(format_name=None, accept=None):
+    """Picks a serializer from an explicit format name, then the Accept header, defaulting to json"""
+    if format_name:
+        if format_name not in SERIALIZERS:
+            raise ValueError("Format must be one of: " + ', '.join(SERIALIZERS))
+        return SERIALIZERS[format_name]
+    for media_range in (accept or '').split(','):
+        name = ACCEPT_FORMATS.get(media_range.split(';')[0].strip())
+        if name in SERIALIZERS:
+            return SERIALIZERS[name]
+    return SERIALIZERS['json']
@@ -0,0 +1,116 @@
+import logging
+import time
+from contextvars import ContextVar
+from os import getenv
+
+logger = logging.getLogger(__name__)
+
+# Span the code running now is inside of, None when nothing is being traced
+current_span = ContextVar('current_span', default=None)
+
+
+class Span:
+    """
+    One timed step of a request. Spans opened while another is current become
+    its children, including in tasks started from inside it, as asyncio copies
+    the context into new tasks. Use as a context manager via span().
+    """
+    __slots__ = ('name', 'attributes', 'start', 'end', 'children', '_token')
+
+    def __init__(self, name, attributes=None):
+        self.name = name
+        self.attributes = attributes or {}
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+        self._token = None
+
+    def __enter__(self):
+        self._token = current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.finish()
+        if exc_type is not None:
+            self.set('error', exc_type.__name__)
+        current_span.reset(self._token)
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    @property
+    def duration(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    def format(self, root_start=None, depth=0):
+        """Indented tree of this span and its children, with start offsets and durations in ms"""
+        root_start = self.start if root_start is None else root_start
+        attributes = ' '.join('%s=%s' % item for item in self.attributes.items())
+        lines = ['%s%-*s +%8.1fms %8.1fms %s' % (
+            '  ' * depth, max(1, 32 - 2 * depth), self.name, (self.start - root_start) * 1000,
+            self.duration * 1000, attributes)]
+        for child in sorted(self.children, key=lambda span: span.start):
+            lines.extend(child.format(root_start, depth + 1))
+        return lines
+
+
+class NoopSpan:
+    """Stands in for a span when the request isn't traced, so instrumented code costs next to nothing"""
+
+    def set(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+def span(name, **attributes):
+    """Returns a child span of the current one, or a no-op if nothing is being traced"""
+    parent = current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    child = Span(name, attributes)
+    parent.children.append(child)
+    return child
+
+
+class Tracer:
+    """
+    Starts a root span per request, and logs the whole span tree for requests
+    slower than SLOW_REQUEST_MS (1000 by default). Set TRACING=0 to turn it off.
+    """
+
+    def __init__(self, slow_request_ms=None, enabled=None):
+        self.slow_request_seconds = float(slow_request_ms or getenv("SLOW_REQUEST_MS", 1000)) / 1000
+        self.enabled = enabled if enabled is not None else getenv("TRACING", "1") != "0"
+
+    def start(self, name, **attributes):
+        """
+        Makes a new root span current, returns it or None if tracing is off.
+        Tornado runs each request in its own task, so it's never unset.
+        """
+        if not self.enabled:
+            return None
+        root = Span(name, attributes)
+        current_span.set(root)
+        return root
+
+    def finish(self, root):
+        if root is None:
+            return
+        root.finish()
+        if root.duration >= self.slow_request_seconds:
+            logger.warning("Slow request, %.1fms:\n%s", root.duration * 1000, '\n'.join(root.format()))
+
+
+tracer = Tracer()
@@ -0,0 +1,87 @@
+import logging
+from os import getenv
+from urllib.parse import urlsplit
+
+from tornado.httpclient import AsyncHTTPClient
+from tornado.locks import Semaphore
+
+
+CURL_CLIENT = "tornado.curl_httpclient.CurlAsyncHTTPClient"
+logger = logging.getLogger(__name__)
+
+
+class Transport:
+    """
+    Shared HTTP transport used by every weather client.
+
+    Wraps tornado's per-IOLoop AsyncHTTPClient singleton so all providers share
+    one connection pool, with an extra per-host cap so one slow provider can't
+    take every slot. The curl backend keeps connections alive between requests
+    and is used whenever pycurl is installed, the simple client it falls back
+    to opens a new connection per request.
+    """
+
+    def __init__(self, max_clients=64, max_per_host=16, use_curl=None,
+                 connect_timeout=5.0, request_timeout=20.0):
+        self.max_clients = max_clients
+        self.max_per_host = max_per_host
+        self.use_curl = use_curl
+        self.connect_timeout = connect_timeout
+        self.request_timeout = request_timeout
+        self._host_limits = {}
+
+    def configure(self):
+        """Configure the AsyncHTTPClient implementation, call before the IOLoop starts"""
+        impl = None
+        if self.use_curl is not False:
+            try:
+                import pycurl  # noqa: F401
+                impl = CURL_CLIENT
+                self.use_curl = True
+            except ImportError:
+                if self.use_curl:
+                    logger.warning("pycurl is not installed, falling back to the simple http client")
+                else:
+                    logger.info("pycurl is not installed, using the simple http client without keep-alive")
+                self.use_curl = False
+        AsyncHTTPClient.configure(impl, max_clients=self.max_clients, defaults={
+            'connect_timeout': self.connect_timeout,
+            'request_timeout': self.request_timeout,
+        })
+
+    def configure_from_env(self):
+        self.max_clients = int(getenv("HTTP_MAX_CLIENTS", self.max_clients))
+        self.max_per_host = int(getenv("HTTP_MAX_PER_HOST", self.max_per_host))
+        use_curl = getenv("HTTP_USE_CURL")
+        if use_curl is not None:
+            self.use_curl = use_curl.lower() in ('1', 'true', 'yes')
+        self.connect_timeout = float(getenv("HTTP_CONNECT_TIMEOUT", self.connect_timeout))
+        self.request_timeout = float(getenv("HTTP_REQUEST_TIMEOUT", self.request_timeout))
+        self.configure()
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = Semaphore(self.max_per_host)
+        return self._host_limits[host]
+
+    async def fetch(self, url, **kwargs):
+        async with self._host_limit(url):
+            return await AsyncHTTPClient().fetch(url, **kwargs)
+
+    async def warm(self, url):
+        """
+        Opens a connection to the host of url that the curl client keeps in its
+        pool, so the first real request skips DNS / TLS setup. The simple client
+        would throw the connection away, so there's nothing to warm without curl.
+        """
+        if not self.use_curl:
+            return
+        parts = urlsplit(url)
+        try:
+            await self.fetch(f"{parts.scheme}://{parts.netloc}/", method='HEAD', raise_error=False)
+        except Exception as e:
+            logger.warning("Couldn't warm connection to %s: %s", parts.netloc, e)
+
+
+transport = Transport()
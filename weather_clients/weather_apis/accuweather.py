@@ -1,18 +1,25 @@
-import requests
 import json
+import logging
 from datetime import datetime
 from os import getenv
-from tornado.httpclient import AsyncHTTPClient
 from tornado.httputil import url_concat
 
+from .. import tracing
+from ..disk_cache import location_cache
 from .base import WeatherDataClient
-from .utils.definitions import accuweather_weather_code_lookup, no_data_value, open_weather_visibility_lookup, uv_lookup_codes
+from .utils.definitions import accuweather_weather_code_lookup, no_data_value
+from .utils.forecast_series import ForecastSeries
 
 # AccuWeather
 ACCUWEATHER_API_KEY = getenv("ACCUWEATHER_API_KEY")
+logger = logging.getLogger(__name__)
 
 
 class AccuWeatherClient(WeatherDataClient):
+    cache_ttl = 1800
+    daily_quota = 50
+    visibility_unit = 'km'
+
     def __init__(self):
         self.base_url = "http://dataservice.accuweather.com/"
         self.params = {
@@ -22,65 +29,70 @@ class AccuWeatherClient(WeatherDataClient):
             'metric': 'true'
         }
 
-    def get_location_code(self, lat, lon):
-        endpoint = "locations/v1/cities/geoposition/search"
-        lat_lon = {'q': f'{lat},{lon}'}
-        response = requests.get(self.base_url + endpoint,
-                                params={**self.params, **lat_lon})
-        response_data = response.json()
-        return response_data['Key']
+    async def get_location_code(self, lat, lon):
+        # Location keys cover a town or so, round to ~1km so nearby points share a key
+        lat, lon = round(float(lat), 2), round(float(lon), 2)
+        cache_key = f"accuweather:{lat},{lon}"
+        with tracing.span('location', provider='AccuWeatherClient') as location_span:
+            location_code = location_cache.get(cache_key)
+            if location_code is None:
+                endpoint = "locations/v1/cities/geoposition/search"
+                lat_lon = {'q': f'{lat},{lon}'}
+                response = await self.fetch(url_concat(self.base_url + endpoint, {**self.params, **lat_lon}))
+                location_code = json.loads(response.body)['Key']
+                location_cache.set(cache_key, location_code)
+            location_span.set('key', location_code)
+        return location_code
+
+    async def location_key(self, lat, lon):
+        return await self.get_location_code(lat, lon)
 
     async def get_forecast(self, location_code):
-        http_client = AsyncHTTPClient()
         try:
             endpoint = url_concat(
                 self.base_url + f"/forecasts/v1/hourly/12hour/{location_code}", self.params)
-            response = await http_client.fetch(endpoint)
+            response = await self.fetch(endpoint)
         except Exception as e:
-            print("Error: %s" % e)
-        return json.loads(response.body)
+            logger.warning("AccuWeather forecast for %s failed: %s", location_code, e)
+            raise
+        return response.body
 
     async def get_forecast_lat_lon(self, lat, lon):
-        location_code = self.get_location_code(lat, lon)
+        location_code = await self.get_location_code(lat, lon)
         forecast_data = await self.get_forecast(location_code=location_code)
-        processed_data = self.process_data(forecast_data, lat, lon)
+        processed_data = await self.parse(forecast_data, lat, lon)
         return processed_data
 
     def process_data(self, data, lat, lon):
-        processed_weather_data = []
         place_name = None
+        processed_weather_data = ForecastSeries(lat, lon, place_name)
         for hourly in data:
-            processed_data = {
-                'lat': lat,
-                'lon': lon,
-                'place_name': place_name,
-                'date_time': datetime.fromtimestamp(hourly['EpochDateTime']),
-                'temperature_celcius': float(hourly['Temperature']['Value']),
-                'feels_like_temperature_celcius': float(hourly['RealFeelTemperature']['Value']),
-                'wind_speed_kph': float(hourly['Wind']['Speed']['Value']),
-                'wind_direction': hourly['Wind']['Direction']['Localized'],
-                'wind_gust_mph': float(hourly['WindGust']['Speed']['Value']),
-                'relative_humidity_percentage': float(hourly['RelativeHumidity']),
-                'visibility': open_weather_visibility_lookup(hourly['Visibility']['Value'] * 1000),
-                'uv_index': {'code': hourly['UVIndex'], 'description': uv_lookup_codes[str(hourly['UVIndex'])]},
-                'weather_type': accuweather_weather_code_lookup[hourly['WeatherIcon']],
-                'precipitation_probability_percentage': float(hourly['PrecipitationProbability']),
-            }
-            processed_weather_data.append(processed_data)
-        return processed_weather_data
+            processed_weather_data.append(
+                date_time=datetime.fromtimestamp(hourly['EpochDateTime']),
+                temperature_celcius=float(hourly['Temperature']['Value']),
+                feels_like_temperature_celcius=float(hourly['RealFeelTemperature']['Value']),
+                wind_speed=float(hourly['Wind']['Speed']['Value']),
+                wind_direction=hourly['Wind']['Direction']['Localized'],
+                wind_gust=float(hourly['WindGust']['Speed']['Value']),
+                relative_humidity_percentage=float(hourly['RelativeHumidity']),
+                visibility_distance=float(hourly['Visibility']['Value']),
+                uv_index=hourly['UVIndex'],
+                weather_type=accuweather_weather_code_lookup[hourly['WeatherIcon']],
+                precipitation_probability_percentage=float(hourly['PrecipitationProbability']))
+        return self.normalise(processed_weather_data)
 
-    def get_forecast_postcode(self, country, postcode):
-        lat, lon = self.geocode_postcode(country, postcode)
-        location_code = self.get_location_code(lat, lon)
-        forecast_data = self.get_forecast(location_code=location_code)
-        processed_data = self.process_data(forecast_data, lat, lon)
+    async def get_forecast_postcode(self, country, postcode):
+        lat, lon = await self.geocode_postcode(country, postcode)
+        location_code = await self.get_location_code(lat, lon)
+        forecast_data = await self.get_forecast(location_code=location_code)
+        processed_data = await self.parse(forecast_data, lat, lon)
         return processed_data
 
-    def get_forecast_city_country(self, city, country):
-        lat, lon = self.geocode_city_country(city, country)
-        location_code = self.get_location_code(lat, lon)
-        forecast_data = self.get_forecast(location_code=location_code)
-        processed_data = self.process_data(forecast_data, lat, lon)
+    async def get_forecast_city_country(self, city, country):
+        lat, lon = await self.geocode_city_country(city, country)
+        location_code = await self.get_location_code(lat, lon)
+        forecast_data = await self.get_forecast(location_code=location_code)
+        processed_data = await self.parse(forecast_data, lat, lon)
         return processed_data
 
 
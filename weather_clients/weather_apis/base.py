@@ -1,14 +1,111 @@
 from abc import ABC, abstractmethod
-from geopy.geocoders import Nominatim
-from math import radians, cos, sin, asin, sqrt
-import pgeocode
+import time
+from hashlib import sha1
+from io import BytesIO
+from math import asin, cos, radians, sin, sqrt
 from typing import Tuple
 
+from tornado.httpclient import HTTPClientError, HTTPRequest, HTTPResponse
+
+from .. import metrics, tracing
+
+from ..disk_cache import response_cache
+from ..geocoding import city_geocoder, postcode_geocoder
+from ..parsing import parser
+from ..rate_limit import BACKGROUND, request_priority, scheduler
+from ..transport import transport
+from .utils.distance import distance_matrix, haversine_km, nearest
+from .utils.forecast_series import ForecastSeries
+from .utils.spatial import EARTH_RADIUS_KM
+from .utils.normalization import normalise
+
 
 class WeatherDataClient(ABC):
+    # Seconds a processed forecast can be served from cache, roughly the provider's update cadence
+    cache_ttl = 900
+    # Most upstream requests to have in flight at once when working through a batch
+    max_concurrency = 4
+    # Upstream API limits, None for no limit. Defaults are the providers' free tiers
+    requests_per_minute = None
+    daily_quota = None
+    # Units of the raw wind_speed / wind_gust (kph, mph or ms) and visibility_distance (m or km) fields
+    speed_unit = 'kph'
+    visibility_unit = 'm'
+
     def __init__(self):
         raise NotImplementedError
 
+    async def warm(self):
+        """Hook for one-off setup run at application startup"""
+        await transport.warm(self.base_url)
+
+    async def prefill(self):
+        """Hook to fill the on-disk caches every server process reads at startup, run once before forking"""
+        pass
+
+    async def fetch(self, url, **kwargs):
+        """
+        Fetch url through the shared transport. Successful responses are kept on
+        disk for cache_ttl seconds and served from there on later calls, apart
+        from background refreshes which always go upstream.
+        Raises QuotaExceeded if the provider is out of budget.
+        """
+        provider = self.__class__.__name__
+        key = f"{provider}:{sha1(url.encode()).hexdigest()}"
+        if request_priority.get() != BACKGROUND:
+            body = await response_cache.get_async(key)
+            metrics.cache_requests.labels('response', 'miss' if body is None else 'hit').inc()
+            if body is not None:
+                return HTTPResponse(HTTPRequest(url), 200, buffer=BytesIO(body))
+        with tracing.span('rate_limit', provider=provider):
+            await scheduler.acquire(self)
+        response = await self.fetch_upstream(provider, url, **kwargs)
+        if response.code == 200:
+            response_cache.set_async(key, response.body, ttl=self.cache_ttl)
+        return response
+
+    async def fetch_upstream(self, provider, url, **kwargs):
+        """transport.fetch, recording latency, bytes and failures per provider"""
+        in_flight = metrics.upstream_in_flight.labels(provider)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            with tracing.span('fetch', provider=provider) as fetch_span:
+                response = await transport.fetch(url, **kwargs)
+                fetch_span.set('bytes', len(response.body or b''))
+        except HTTPClientError as e:
+            # Tornado reports timeouts as 599s
+            metrics.upstream_errors.labels(provider, 'timeout' if e.code == 599 else 'http').inc()
+            raise
+        except OSError:
+            metrics.upstream_errors.labels(provider, 'network').inc()
+            raise
+        finally:
+            in_flight.dec()
+            metrics.upstream_request_seconds.labels(provider).observe(time.perf_counter() - start)
+        metrics.upstream_response_bytes.labels(provider).inc(len(response.body or b''))
+        return response
+
+    async def parse(self, body, *args):
+        """
+        Decodes a JSON response body and runs process_data(data, *args) on it,
+        large bodies off the IOLoop depending on PARSE_EXECUTOR
+        """
+        return await parser.parse(self, body, *args)
+
+    def normalise(self, forecast):
+        """Converts a processed series, or a dict of them, from the provider's units into the canonical ones"""
+        if isinstance(forecast, ForecastSeries):
+            return normalise(forecast, self.speed_unit, self.visibility_unit)
+        return {name: self.normalise(series) for name, series in forecast.items()}
+
+    async def location_key(self, lat, lon):
+        """
+        Returns the key the provider's forecast is really for, points with the
+        same key get the same forecast. By default lat / lon to ~1km.
+        """
+        return f"{round(float(lat), 2)},{round(float(lon), 2)}"
+
     @abstractmethod
     def process_data(self, data: any):
         raise NotImplementedError
@@ -17,49 +114,47 @@ class WeatherDataClient(ABC):
     def get_forecast_lat_lon(self, lat: float, lon: float):
         raise NotImplementedError
 
-    def get_forecast_postcode(self, country: str, postcode: str):
-        lat, lon = self.geocode_postcode(country, postcode)
-        return self.get_forecast_lat_lon(lat, lon)
+    async def get_forecast_postcode(self, country: str, postcode: str):
+        lat, lon = await self.geocode_postcode(country, postcode)
+        return await self.get_forecast_lat_lon(lat, lon)
 
-    def get_forecast_city_country(self, city, country):
-        lat, lon = self.geocode_city_country(city, country)
-        return self.get_forecast_lat_lon(
+    async def get_forecast_city_country(self, city, country):
+        lat, lon = await self.geocode_city_country(city, country)
+        return await self.get_forecast_lat_lon(
             lat=lat, lon=lon)
 
     @staticmethod
-    def geocode_postcode(country_code: str, postcode: str) -> Tuple[float, float]:
+    async def geocode_postcode(country_code: str, postcode: str) -> Tuple[float, float]:
         """Returns the lat and lon of the nearest point to the provided postcode"""
-        if country_code not in pgeocode.COUNTRIES_VALID:
-            raise ValueError("Country code must be one of: " +
-                             ', '.join(pgeocode.COUNTRIES_VALID))
-        nomi = pgeocode.Nominatim(country_code)
-        query = nomi.query_postal_code(postcode)
-        if str(query['latitude']) == 'nan' or str(query['longitude']) == 'nan':
-            raise ValueError("Couldn't geocode that postcode.")
-        return query['latitude'], query['longitude']
+        return await postcode_geocoder.lookup(country_code, postcode)
 
     @staticmethod
-    def geocode_city_country(city: str, country: str) -> Tuple[float, float]:
+    async def geocode_city_country(city: str, country: str) -> Tuple[float, float]:
         """Returns the lat / lon of the city / country combination"""
-        geolocator = Nominatim(user_agent="my_test")
-        location = geolocator.geocode(f"{city}, {country}")
-        return location.latitude, location.longitude
+        return await city_geocoder.geocode(city, country)
 
     @staticmethod
     def haversine(lat1: str, lon1: str, lat2: str, lon2: str) -> float:
         """
         Calculate the great circle distance between two points 
-        on the earth (specified in decimal degrees)
+        on the earth (specified in decimal degrees). Arrays go through
+        haversine_km, for one pair numpy's per call overhead is most of the cost.
         """
-        lat1, lon1, lat2, lon2 = float(lat1), float(
-            lon1), float(lat2), float(lon2)
-        # convert decimal degrees to radians
-        lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-
-        # haversine formula
-        dlon = lon2 - lon1
-        dlat = lat2 - lat1
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * asin(sqrt(a))
-        r = 6371  # Radius of earth in kilometers. Use 3956 for miles
-        return c * r
+        if not all(isinstance(x, (str, int, float)) for x in (lat1, lon1, lat2, lon2)):
+            return haversine_km(lat1, lon1, lat2, lon2)
+        lat1, lon1, lat2, lon2 = map(radians, map(float, (lat1, lon1, lat2, lon2)))
+        a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+
+    @staticmethod
+    def batch_haversine(query_lats, query_lons, lats, lons):
+        """
+        Distances in km from each query point to each candidate point as an
+        (n_queries, n_points) array, computed in a single vectorised pass
+        """
+        return distance_matrix(query_lats, query_lons, lats, lons)
+
+    @staticmethod
+    def closest_points(query_lats, query_lons, lats, lons, k: int = 1):
+        """Returns (indices, distances_km) of the k closest candidates to each query point"""
+        return nearest(query_lats, query_lons, lats, lons, k)
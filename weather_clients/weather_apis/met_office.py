@@ -1,28 +1,54 @@
-import requests
 import json
-from datetime import datetime, timedelta
+import logging
+from datetime import datetime, timedelta, timezone
 from os import getenv
-from tornado.httpclient import AsyncHTTPClient
 
+from .. import tracing
+from ..disk_cache import location_cache
 from .base import WeatherDataClient
-from .utils.definitions import visibility_lookup_codes, uv_lookup_codes, weather_lookup_codes
+from .utils.spatial import SpatialIndex
+from .utils.definitions import visibility_lookup_codes, weather_lookup_codes
+from .utils.forecast_series import ForecastSeries
 
 
 # Met office
 MET_OFFICE_API_KEY = getenv("MET_OFFICE_API_KEY")
+logger = logging.getLogger(__name__)
+SITELIST_TTL = 24 * 3600
 
 
 class MetOfficeClient(WeatherDataClient):
+    cache_ttl = 3600
+    requests_per_minute = 100
+    daily_quota = 5000
+    speed_unit = 'mph'
+
     def __init__(self):
         self.base_url = "http://datapoint.metoffice.gov.uk/public/data/"
-        self.locations = self.load_locations()
+        self.locations = []
+        self.location_index = None
         self.location_code = None
 
-    def load_locations(self):
-        locations_response = requests.get(
-            f"{self.base_url}val/wxfcs/all/json/sitelist?key={MET_OFFICE_API_KEY}")
-        data = locations_response.json()
-        locations = data['Locations']['Location']
+    async def warm(self):
+        await super().warm()
+        await self.ensure_locations()
+
+    async def prefill(self):
+        await self.load_locations()
+
+    async def ensure_locations(self):
+        if not self.locations:
+            self.locations = await self.load_locations()
+            self.location_index = SpatialIndex(self.locations)
+
+    async def load_locations(self):
+        locations = location_cache.get('met_office:sitelist')
+        if locations is None:
+            locations_response = await self.fetch(
+                f"{self.base_url}val/wxfcs/all/json/sitelist?key={MET_OFFICE_API_KEY}")
+            data = json.loads(locations_response.body)
+            locations = data['Locations']['Location']
+            location_cache.set('met_office:sitelist', locations, ttl=SITELIST_TTL)
         return locations
 
     def get_location_code(self, place_name=None, lat=None, lon=None):
@@ -33,65 +59,66 @@ class MetOfficeClient(WeatherDataClient):
 
                 self.location_code = loc[0]['id']
             except Exception as e:
-                print("Place name not found", e)
+                logger.warning("Place name %r not found: %s", place_name, e)
         elif lat and lon:
             self.location_code = self.get_closest_location(lat, lon)['id']
         return self.location_code
 
     def get_closest_location(self, lat, lon):
-        # Get distances
-        locations = self.locations.copy()
-        for location in locations:
-            location['dist'] = self.haversine(
-                lat, lon, location['latitude'], location['longitude'])
-        # Sort on distances and return closest
-        return sorted(locations, key=lambda x: x['dist'])[0]
+        location, _ = self.location_index.nearest(lat, lon)
+        return location
+
+    async def location_key(self, lat, lon):
+        await self.ensure_locations()
+        return self.get_closest_location(lat, lon)['id']
+
+    def get_closest_locations(self, lat, lon, k=5):
+        """Returns a list of (location, distance_km) for the k closest sites"""
+        return self.location_index.k_nearest(lat, lon, k)
 
     def process_data(self, data):
         '''Takes raw met office data and processes into a list of dicts'''
 
-        processed_weather_data = []
         lat = float(data['SiteRep']['DV']['Location']['lat'])
         lon = float(data['SiteRep']['DV']['Location']['lon'])
         place_name = data['SiteRep']['DV']['Location']['name']
+        processed_weather_data = ForecastSeries(lat, lon, place_name, naive_tz=timezone.utc)
         for day in data['SiteRep']['DV']['Location']['Period']:
             for three_hourly in day['Rep']:
-                processed_data = {
-                    'lat': lat,
-                    'lon': lon,
-                    'place_name': place_name,
-                    'date_time': datetime.strptime(day['value'], '%Y-%M-%dZ') + timedelta(minutes=int(three_hourly['$'])),
-                    'temperature_celcius': float(three_hourly['T']),
-                    'feels_like_temperature_celcius': float(three_hourly['F']),
-                    'wind_gust_mph': float(three_hourly['G']),
-                    'relative_humidity_percentage': float(three_hourly['H']),
-                    'visibility': visibility_lookup_codes[three_hourly['V']],
-                    'wind_direction': three_hourly['D'],
-                    'wind_speed_mph': float(three_hourly['S']),
-                    'uv_index': {'code': three_hourly['U'], 'description': uv_lookup_codes[str(three_hourly['U'])]},
-                    'weather_type': weather_lookup_codes[three_hourly['W']],
-                    'precipitation_probability_percentage': float(three_hourly['Pp']),
-                }
-                processed_weather_data.append(processed_data)
-        return processed_weather_data
+                processed_weather_data.append(
+                    date_time=datetime.strptime(day['value'], '%Y-%m-%dZ') + timedelta(minutes=int(three_hourly['$'])),
+                    temperature_celcius=float(three_hourly['T']),
+                    feels_like_temperature_celcius=float(three_hourly['F']),
+                    wind_gust=float(three_hourly['G']),
+                    relative_humidity_percentage=float(three_hourly['H']),
+                    visibility=visibility_lookup_codes[three_hourly['V']],
+                    wind_direction=three_hourly['D'],
+                    wind_speed=float(three_hourly['S']),
+                    uv_index=three_hourly['U'],
+                    weather_type=weather_lookup_codes[three_hourly['W']],
+                    precipitation_probability_percentage=float(three_hourly['Pp']))
+        return self.normalise(processed_weather_data)
 
     async def get_forecast(self, location_code=None):
         if not location_code:
             location_code = self.location_code
         try:
-            http_client = AsyncHTTPClient()
-            response = await http_client.fetch(f"{self.base_url}val/wxfcs/all/json/{location_code}?res=3hourly&key={MET_OFFICE_API_KEY}")
+            response = await self.fetch(f"{self.base_url}val/wxfcs/all/json/{location_code}?res=3hourly&key={MET_OFFICE_API_KEY}")
         except Exception as e:
-            print("Error: %s" % e)
-        return json.loads(response.body)
+            logger.warning("Met Office forecast for %s failed: %s", location_code, e)
+            raise
+        return response.body
 
     async def get_forecast_lat_lon(self, lat: float, lon: float):
         """
         Return 3 days of forecast data based on the provided lat and lon
         """
-        closest_location_id = self.get_closest_location(lat, lon)['id']
+        with tracing.span('location', provider='MetOfficeClient') as location_span:
+            await self.ensure_locations()
+            closest_location_id = self.get_closest_location(lat, lon)['id']
+            location_span.set('key', closest_location_id)
         forecast = await self.get_forecast(location_code=closest_location_id)
-        processed_data = self.process_data(forecast)
+        processed_data = await self.parse(forecast)
         return processed_data
 
 
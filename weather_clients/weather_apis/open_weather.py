@@ -1,12 +1,11 @@
 import requests
 from datetime import datetime
 from os import getenv
-from tornado.httpclient import AsyncHTTPClient
 from tornado.httputil import url_concat
-import json
 
 from .base import WeatherDataClient
-from .utils.definitions import no_data_value, open_weather_visibility_lookup, open_weather_wind_direction_lookup, uv_lookup_codes, no_data_value
+from .utils.definitions import no_data_value
+from .utils.forecast_series import ForecastSeries
 
 # Open Weather
 OPEN_WEATHER_API_KEY = getenv("OPEN_WEATHER_API_KEY")
@@ -15,35 +14,35 @@ OPEN_WEATHER_API_KEY = getenv("OPEN_WEATHER_API_KEY")
 class OpenWeatherClient(WeatherDataClient):
     """ Openweather API client class """
 
+    cache_ttl = 600
+    requests_per_minute = 60
+    daily_quota = 1000
+    speed_unit = 'ms'
+
     def __init__(self):
         self.exclude = "minutely"
         self.base_url = f"https://api.openweathermap.org/data/2.5/onecall"
 
     def process_data(self, raw_data):
-        data = []
         lat = raw_data['lat']
         lon = raw_data['lon']
         # Possibly use met office for this? Need a common set of names...
         place_name = None
+        data = ForecastSeries(lat, lon, place_name)
         for hourly in [raw_data['current'], *raw_data['hourly']]:
-            processed_data = {
-                'lat': lat,
-                'lon': lon,
-                'place_name': place_name,
-                'date_time': datetime.fromtimestamp(hourly['dt']),
-                'temperature_celcius': float(hourly['temp']),
-                'feels_like_temperature_celcius': float(hourly['feels_like']),
-                'wind_gust_mph': float(hourly.get('wind_gust', no_data_value)),
-                'relative_humidity_percentage': float(hourly['humidity']),
-                'visibility': open_weather_visibility_lookup(hourly['visibility']),
-                'wind_direction': open_weather_wind_direction_lookup(hourly['wind_deg']),
-                'wind_speed_mph': float(hourly['wind_speed']),
-                'uv_index': {'code': hourly['uvi'], 'description': uv_lookup_codes[str(int(hourly['uvi']))]},
-                'weather_type': hourly['weather'][0]['description'],
-                'precipitation_probability_percentage': float(hourly.get('pop', no_data_value)),
-            }
-            data.append(processed_data)
-        return data
+            data.append(
+                date_time=datetime.fromtimestamp(hourly['dt']),
+                temperature_celcius=float(hourly['temp']),
+                feels_like_temperature_celcius=float(hourly['feels_like']),
+                wind_gust=float(hourly.get('wind_gust', no_data_value)),
+                relative_humidity_percentage=float(hourly['humidity']),
+                visibility_distance=float(hourly['visibility']),
+                wind_direction_degrees=float(hourly['wind_deg']),
+                wind_speed=float(hourly['wind_speed']),
+                uv_index=hourly['uvi'],
+                weather_type=hourly['weather'][0]['description'],
+                precipitation_probability_percentage=float(hourly.get('pop', no_data_value)))
+        return self.normalise(data)
 
     async def get_forecast_lat_lon(self, lat, lon):
         params = {
@@ -53,9 +52,8 @@ class OpenWeatherClient(WeatherDataClient):
             'appid': OPEN_WEATHER_API_KEY,
             'units': 'metric'
         }
-        http_client = AsyncHTTPClient()
-        response = await http_client.fetch(url_concat(self.base_url, params))
-        data = self.process_data(json.loads(response.body))
+        response = await self.fetch(url_concat(self.base_url, params))
+        data = await self.parse(response.body)
         return data
 
 
@@ -1,18 +1,23 @@
 from datetime import datetime
-import json
 from os import getenv
 
-from tornado.httpclient import AsyncHTTPClient
 from tornado.httputil import url_concat
 
 from .base import WeatherDataClient
-from .utils.definitions import no_data_value, open_weather_wind_direction_lookup, open_weather_visibility_lookup
+from .utils.definitions import no_data_value
+from .utils.forecast_series import ForecastSeries
 
 # Stormglass.io
 STORM_GLASS_API_KEY = getenv("STORM_GLASS_API_KEY")
 
 
 class StormGlassClient(WeatherDataClient):
+    cache_ttl = 3600
+    max_concurrency = 2
+    daily_quota = 10
+    speed_unit = 'ms'
+    visibility_unit = 'km'
+
     def __init__(self):
         self.base_url = "https://api.stormglass.io/v2"
         self.weather_endpoint = "/weather/point"
@@ -22,37 +27,31 @@ class StormGlassClient(WeatherDataClient):
                         }
 
     async def get_forecast_lat_lon(self, lat, lon):
-        http_client = AsyncHTTPClient()
-        response = await http_client.fetch(url_concat(
+        response = await self.fetch(url_concat(
             self.base_url + self.weather_endpoint, {**self.params, "lat": lat, "lng": lon}), headers=self.headers)
-        data = json.loads(response.body)
-        return self.process_data(data)
+        return await self.parse(response.body)
 
     def process_data(self, data: any):
-        processed_weather_data = {"dwd": [], "noaa": [], "sg": []}
         lat = data['meta']['lat']
         lon = data['meta']['lng']
         place_name = None
+        processed_weather_data = {provider: ForecastSeries(lat, lon, place_name)
+                                  for provider in ["dwd", "noaa", "sg"]}
         for hourly in data['hours']:
             for provider in ["dwd", "noaa", "sg"]:
-                processed_data = {
-                    'lat': lat,
-                    'lon': lon,
-                    'place_name': place_name,
-                    'date_time': datetime.fromisoformat(hourly['time']),
-                    'temperature_celcius': float(hourly['airTemperature'].get(provider, no_data_value)),
-                    'feels_like_temperature_celcius': None,
-                    'wind_speed_kph': float(hourly['windSpeed'].get(provider, no_data_value)),
-                    'wind_direction': open_weather_wind_direction_lookup(hourly['windDirection'].get(provider, no_data_value)),
-                    'wind_gust_mph': float(hourly['gust'].get(provider, no_data_value)),
-                    'relative_humidity_percentage': float(hourly['humidity'].get(provider, no_data_value)),
-                    'visibility': open_weather_visibility_lookup(hourly['visibility'].get(provider, no_data_value)),
-                    'uv_index': None,
-                    'weather_type': None,
-                    'precipitation_probability_percentage': None,
-                }
-                processed_weather_data[provider].append(processed_data)
-        return processed_weather_data
+                processed_weather_data[provider].append(
+                    date_time=datetime.fromisoformat(hourly['time']),
+                    temperature_celcius=float(hourly['airTemperature'].get(provider, no_data_value)),
+                    feels_like_temperature_celcius=None,
+                    wind_speed=float(hourly['windSpeed'].get(provider, no_data_value)),
+                    wind_direction_degrees=float(hourly['windDirection'].get(provider, no_data_value)),
+                    wind_gust=float(hourly['gust'].get(provider, no_data_value)),
+                    relative_humidity_percentage=float(hourly['humidity'].get(provider, no_data_value)),
+                    visibility_distance=float(hourly['visibility'].get(provider, no_data_value)),
+                    uv_index=None,
+                    weather_type=None,
+                    precipitation_probability_percentage=None)
+        return self.normalise(processed_weather_data)
 
 
 # storm_glass = StormGlassClient()
@@ -1,12 +1,11 @@
-from json import loads
 from datetime import datetime
 from os import getenv
 
-from tornado.httpclient import AsyncHTTPClient
 from tornado.httputil import url_concat
 
 from .base import WeatherDataClient
-from .utils.definitions import open_weather_wind_direction_lookup, open_weather_visibility_lookup, tomorrow_io_weather_code_lookup
+from .utils.definitions import tomorrow_io_weather_code_lookup
+from .utils.forecast_series import ForecastSeries
 
 
 # Tomorrow.io
@@ -14,6 +13,11 @@ TOMORROW_API_KEY = getenv("TOMORROW_API_KEY")
 
 
 class TomorrowIOClient(WeatherDataClient):
+    cache_ttl = 900
+    daily_quota = 500
+    speed_unit = 'ms'
+    visibility_unit = 'km'
+
     def __init__(self):
         self.base_url = f'https://api.tomorrow.io/v4/timelines'
         self.params = {
@@ -24,33 +28,26 @@ class TomorrowIOClient(WeatherDataClient):
 
     async def get_forecast_lat_lon(self, lat, lon):
         params = {**self.params, 'location': f"{lat},{lon}"}
-        http_client = AsyncHTTPClient()
-        response = await http_client.fetch(url_concat(self.base_url, params))
-        raw_data = loads(response.body)
-        return self.process_data(raw_data, lat, lon)
+        response = await self.fetch(url_concat(self.base_url, params))
+        return await self.parse(response.body, lat, lon)
 
     def process_data(self, data, lat, lon):
-        processed_weather_data = []
         place_name = None
+        processed_weather_data = ForecastSeries(lat, lon, place_name)
         for hourly in data['data']['timelines'][0]['intervals']:
-            processed_data = {
-                'lat': lat,
-                'lon': lon,
-                'place_name': place_name,
-                'date_time': datetime.strptime(hourly['startTime'], '%Y-%m-%dT%H:%M:%S%z'),
-                'temperature_celcius': float(hourly['values']['temperature']),
-                'feels_like_temperature_celcius': float(hourly['values']['temperatureApparent']),
-                'wind_speed_kph': float(hourly['values']['windSpeed']),
-                'wind_direction': open_weather_wind_direction_lookup(hourly['values']['windDirection']),
-                'wind_gust_mph': float(hourly['values']['windGust']),
-                'relative_humidity_percentage': float(hourly['values']['humidity']),
-                'visibility': open_weather_visibility_lookup(hourly['values']['visibility']),
-                'uv_index': None,
-                'weather_type': tomorrow_io_weather_code_lookup[hourly['values']['weatherCode']],
-                'precipitation_probability_percentage': float(hourly['values']['precipitationProbability']),
-            }
-            processed_weather_data.append(processed_data)
-        return processed_weather_data
+            processed_weather_data.append(
+                date_time=datetime.strptime(hourly['startTime'], '%Y-%m-%dT%H:%M:%S%z'),
+                temperature_celcius=float(hourly['values']['temperature']),
+                feels_like_temperature_celcius=float(hourly['values']['temperatureApparent']),
+                wind_speed=float(hourly['values']['windSpeed']),
+                wind_direction_degrees=float(hourly['values']['windDirection']),
+                wind_gust=float(hourly['values']['windGust']),
+                relative_humidity_percentage=float(hourly['values']['humidity']),
+                visibility_distance=float(hourly['values']['visibility']),
+                uv_index=None,
+                weather_type=tomorrow_io_weather_code_lookup[hourly['values']['weatherCode']],
+                precipitation_probability_percentage=float(hourly['values']['precipitationProbability']))
+        return self.normalise(processed_weather_data)
 
 
 # tomorrow_io = TomorrowIOClient()
@@ -1,3 +1,5 @@
+from bisect import bisect_right
+
 no_data_value = 99999
 
 weather_lookup_codes = {
@@ -59,43 +61,33 @@ uv_lookup_codes = {
 }
 
 
+# Upper bounds in metres of each visibility band, for bisecting into VISIBILITY_BANDS
+VISIBILITY_BOUNDARIES_METRES = (1000, 4000, 10000, 20000, 40000, 100000)
+VISIBILITY_BANDS = (
+    'Very poor - Less than 1 km',
+    'Poor - Between 1-4 km',
+    'Moderate - Between 4-10 km',
+    'Good - Between 10-20 km',
+    'Very good - Between 20-40 km',
+    'Excellent - More than 40 km',
+    'Unknown',
+)
+# Upper bounds in degrees of each compass sector, N wraps round past 330
+WIND_DIRECTION_BOUNDARIES_DEGREES = (25, 60, 120, 160, 200, 240, 280, 330)
+WIND_DIRECTIONS = ('N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW', 'N')
+
+
 def open_weather_visibility_lookup(visibility_metres: int) -> str:
     """ Returns a string of the visibility based on a the visibility in metres """
-    if visibility_metres < 1000:
-        return 'Very poor - Less than 1 km'
-    elif visibility_metres < 4000:
-        'Poor - Between 1-4 km'
-    elif visibility_metres < 10000:
-        return 'Moderate - Between 4-10 km'
-    elif visibility_metres < 20000:
-        return 'Good - Between 10-20 km'
-    elif visibility_metres < 40000:
-        return 'Very good - Between 20-40 km'
-    elif visibility_metres < 100000:
-        return 'Excellent - More than 40 km'
-    else:
+    if visibility_metres is None or visibility_metres != visibility_metres or visibility_metres < 0:
         return 'Unknown'
+    return VISIBILITY_BANDS[bisect_right(VISIBILITY_BOUNDARIES_METRES, visibility_metres)]
 
 
 def open_weather_wind_direction_lookup(direction_deg: int) -> str:
-    if 330 <= direction_deg <= 25:
-        return 'N'
-    elif 25 <= direction_deg <= 60:
-        return 'NE'
-    elif 60 <= direction_deg <= 120:
-        return 'E'
-    elif 120 <= direction_deg <= 160:
-        return 'SE'
-    elif 160 <= direction_deg <= 200:
-        return 'S'
-    elif 200 <= direction_deg <= 240:
-        return 'SW'
-    elif 240 <= direction_deg <= 280:
-        return 'W'
-    elif 280 <= direction_deg <= 330:
-        return 'NW'
-    else:
+    if direction_deg is None or not 0 <= direction_deg <= 360:
         return 'Unknown'
+    return WIND_DIRECTIONS[bisect_right(WIND_DIRECTION_BOUNDARIES_DEGREES, direction_deg % 360)]
 
 
 accuweather_weather_code_lookup = {1: 'Sunny',
@@ -0,0 +1,42 @@
+import numpy as np
+
+from .spatial import EARTH_RADIUS_KM
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    Great circle distance in km between points given in decimal degrees.
+    Inputs can be scalars or anything array like (including strings of
+    numbers) and are broadcast against each other numpy style.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=np.float64))
+                              for x in (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def distance_matrix(query_lats, query_lons, lats, lons) -> np.ndarray:
+    """Returns an (n_queries, n_points) array of distances in km"""
+    query_lats = np.atleast_1d(np.asarray(query_lats, dtype=np.float64))[:, np.newaxis]
+    query_lons = np.atleast_1d(np.asarray(query_lons, dtype=np.float64))[:, np.newaxis]
+    lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))[np.newaxis, :]
+    lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))[np.newaxis, :]
+    return haversine_km(query_lats, query_lons, lats, lons)
+
+
+def nearest(query_lats, query_lons, lats, lons, k=1):
+    """
+    Returns (indices, distances_km), each shaped (n_queries, k), of the k
+    closest points to each query point ordered closest first.
+    """
+    distances = distance_matrix(query_lats, query_lons, lats, lons)
+    k = min(k, distances.shape[1])
+    if k < distances.shape[1]:
+        candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(k), (distances.shape[0], k))
+    candidate_distances = np.take_along_axis(distances, candidates, axis=1)
+    order = np.argsort(candidate_distances, axis=1)
+    return (np.take_along_axis(candidates, order, axis=1),
+            np.take_along_axis(candidate_distances, order, axis=1))
@@ -0,0 +1,212 @@
+from array import array
+from datetime import datetime, timedelta
+from math import isnan
+from sys import intern
+
+import numpy as np
+
+from .definitions import uv_lookup_codes
+
+NAIVE_EPOCH = datetime(1970, 1, 1)
+CATEGORICAL_FIELDS = {'place_name', 'visibility', 'wind_direction', 'weather_type'}
+
+
+class NumericColumn:
+    """Floats in a typed array, None is stored as NaN"""
+
+    def __init__(self):
+        self.values = array('d')
+
+    @classmethod
+    def from_numpy(cls, values):
+        column = cls()
+        column.values.frombytes(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+        return column
+
+    def append(self, value):
+        self.values.append(float('nan') if value is None else value)
+
+    def get(self, index):
+        value = self.values[index]
+        return None if isnan(value) else value
+
+    def to_list(self):
+        return [None if isnan(value) else value for value in self.values]
+
+    def to_numpy(self):
+        return np.frombuffer(self.values, dtype=np.float64)
+
+    @property
+    def nbytes(self):
+        return self.values.itemsize * len(self.values)
+
+
+class CategoricalColumn:
+    """Repeated strings stored once, with a small integer code per row. Code 0 is None"""
+
+    def __init__(self):
+        self.codes = array('H')
+        self.categories = [None]
+        self._lookup = {None: 0}
+
+    @classmethod
+    def from_codes(cls, codes, categories):
+        """Builds a column from an array of indices into categories"""
+        column = cls()
+        remap = np.array([column.code(category) for category in categories], dtype=np.uint16)
+        column.codes.frombytes(remap[np.asarray(codes)].tobytes())
+        return column
+
+    def code(self, value):
+        code = self._lookup.get(value)
+        if code is None:
+            code = self._lookup[value] = len(self.categories)
+            self.categories.append(intern(value) if isinstance(value, str) else value)
+        return code
+
+    def append(self, value):
+        self.codes.append(self.code(value))
+
+    def get(self, index):
+        return self.categories[self.codes[index]]
+
+    def to_list(self):
+        categories = self.categories
+        return [categories[code] for code in self.codes]
+
+    def to_numpy(self):
+        return np.asarray(self.categories, dtype=object)[np.frombuffer(self.codes, dtype=np.uint16)]
+
+    @property
+    def nbytes(self):
+        return self.codes.itemsize * len(self.codes)
+
+
+class UVColumn(NumericColumn):
+    """
+    UV index stored as its numeric code, the description is looked up when read.
+    The scale is open ended, anything past 11 is described as 11 (extreme).
+    """
+    max_described = 11
+
+    def append(self, value):
+        super().append(None if value is None else float(value))
+
+    def get(self, index):
+        code = super().get(index)
+        if code is None:
+            return None
+        return {'code': int(code) if code.is_integer() else code,
+                'description': uv_lookup_codes[str(min(max(int(code), 0), self.max_described))]}
+
+
+class ForecastSeries:
+    """
+    Columnar store for one provider's forecast at one location. Location
+    metadata is kept once, times are a single array of seconds since the epoch
+    and each field is a typed column, so a cached forecast costs a few bytes
+    per value instead of a dict per hour.
+
+    Build it with append(date_time=..., field=value, ...) once per time step,
+    and use to_rows() for the list of dicts shape served to consumers.
+    """
+
+    def __init__(self, lat, lon, place_name=None, naive_tz=None):
+        self.lat = lat
+        self.lon = lon
+        self.place_name = place_name
+        self.timestamps = array('d')
+        # tzinfo shared by every date_time, None for naive datetimes
+        self.tzinfo = None
+        # Timezone naive date_times are in, None means the server's local time
+        self.naive_tz = naive_tz
+        self.columns = {}
+        # Serialised forms of this series keyed by format, see weather_clients.serialization
+        self.encoded = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['encoded'] = {}
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault('encoded', {})
+        self.__dict__.update(state)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @staticmethod
+    def make_column(name, value):
+        if name == 'uv_index':
+            return UVColumn()
+        if name in CATEGORICAL_FIELDS or isinstance(value, str):
+            return CategoricalColumn()
+        return NumericColumn()
+
+    def append(self, date_time: datetime, **values):
+        if date_time.tzinfo is None:
+            self.timestamps.append((date_time - NAIVE_EPOCH).total_seconds())
+        else:
+            self.tzinfo = date_time.tzinfo
+            self.timestamps.append(date_time.timestamp())
+        for name, value in values.items():
+            column = self.columns.get(name)
+            if column is None:
+                column = self.columns[name] = self.make_column(name, value)
+                for _ in range(len(self) - 1):
+                    column.append(None)
+            column.append(value)
+        if len(values) != len(self.columns):
+            for name, column in self.columns.items():
+                if name not in values:
+                    column.append(None)
+
+    def date_time(self, index):
+        timestamp = self.timestamps[index]
+        if self.tzinfo is None:
+            return NAIVE_EPOCH + timedelta(seconds=timestamp)
+        return datetime.fromtimestamp(timestamp, self.tzinfo)
+
+    def column(self, name) -> np.ndarray:
+        """Returns a numpy view of a numeric column, or an object array of a categorical one"""
+        return self.columns[name].to_numpy()
+
+    def times(self) -> np.ndarray:
+        return np.frombuffer(self.timestamps, dtype=np.float64)
+
+    def utc_times(self) -> np.ndarray:
+        """Returns the true seconds since the epoch of each time step, resolving naive date_times"""
+        if self.tzinfo is not None:
+            return self.times()
+        return np.array([self.date_time(index).replace(tzinfo=self.naive_tz).timestamp()
+                         if self.naive_tz else self.date_time(index).timestamp()
+                         for index in range(len(self))], dtype=np.float64)
+
+    def to_rows(self):
+        rows = []
+        for index in range(len(self)):
+            row = {'lat': self.lat, 'lon': self.lon, 'place_name': self.place_name,
+                   'date_time': self.date_time(index)}
+            for name, column in self.columns.items():
+                row[name] = column.get(index)
+            rows.append(row)
+        return rows
+
+    def to_columns(self):
+        """Returns the series as a dict with one list per field, for column oriented consumers"""
+        return {'lat': self.lat, 'lon': self.lon, 'place_name': self.place_name,
+                'date_time': [self.date_time(index) for index in range(len(self))],
+                'columns': {name: column.to_list() for name, column in self.columns.items()}}
+
+    @property
+    def nbytes(self):
+        return (self.timestamps.itemsize * len(self.timestamps) +
+                sum(column.nbytes for column in self.columns.values()))
+
+
+def json_default(obj):
+    """default hook for json.dumps that expands ForecastSeries into rows"""
+    if isinstance(obj, ForecastSeries):
+        return obj.to_rows()
+    return str(obj)
@@ -0,0 +1,63 @@
+import numpy as np
+
+from .definitions import (VISIBILITY_BANDS, VISIBILITY_BOUNDARIES_METRES, WIND_DIRECTION_BOUNDARIES_DEGREES,
+                          WIND_DIRECTIONS, no_data_value)
+from .forecast_series import CategoricalColumn, NumericColumn
+
+KPH_PER_SPEED_UNIT = {'kph': 1.0, 'mph': 1.609344, 'ms': 3.6}
+METRES_PER_DISTANCE_UNIT = {'m': 1.0, 'km': 1000.0}
+# Raw column a client appends -> canonical column it's replaced with
+SPEED_FIELDS = {'wind_speed': 'wind_speed_kph', 'wind_gust': 'wind_gust_kph'}
+VISIBILITY_FIELD = ('visibility_distance', 'visibility')
+WIND_DIRECTION_FIELD = ('wind_direction_degrees', 'wind_direction')
+
+
+def raw_values(column):
+    """Numeric column as a float array with the no data marker replaced by NaN"""
+    values = np.array(column.to_numpy())
+    values[values == no_data_value] = np.nan
+    return values
+
+
+def to_kph(values, unit):
+    return values * KPH_PER_SPEED_UNIT[unit]
+
+
+def visibility_bands(metres):
+    """Index into VISIBILITY_BANDS for each distance, unknown for missing or negative ones"""
+    bands = np.searchsorted(VISIBILITY_BOUNDARIES_METRES, metres, side='right')
+    bands[~(metres >= 0)] = len(VISIBILITY_BANDS) - 1
+    return bands
+
+
+def wind_direction_sectors(degrees):
+    """Index into WIND_DIRECTIONS for each bearing, -1 where it isn't one"""
+    sectors = np.searchsorted(WIND_DIRECTION_BOUNDARIES_DEGREES, np.mod(degrees, 360), side='right')
+    sectors[~((degrees >= 0) & (degrees <= 360))] = -1
+    return sectors
+
+
+def normalise(series, speed_unit='kph', visibility_unit='m'):
+    """
+    Replaces the raw columns a client appended, in the units it declared, with
+    the canonical ones: speeds in kph, visibility and wind direction as their
+    text bands. Each column is converted in one vectorised pass.
+    """
+    columns = {}
+    for name, column in series.columns.items():
+        if not isinstance(column, NumericColumn):
+            columns[name] = column
+        elif name in SPEED_FIELDS:
+            columns[SPEED_FIELDS[name]] = NumericColumn.from_numpy(to_kph(raw_values(column), speed_unit))
+        elif name == VISIBILITY_FIELD[0]:
+            metres = raw_values(column) * METRES_PER_DISTANCE_UNIT[visibility_unit]
+            columns[VISIBILITY_FIELD[1]] = CategoricalColumn.from_codes(visibility_bands(metres), VISIBILITY_BANDS)
+        elif name == WIND_DIRECTION_FIELD[0]:
+            # Index -1 picks the trailing 'Unknown' for bearings that aren't valid
+            sectors = wind_direction_sectors(raw_values(column))
+            columns[WIND_DIRECTION_FIELD[1]] = CategoricalColumn.from_codes(sectors, WIND_DIRECTIONS + ('Unknown',))
+        else:
+            columns[name] = column
+    series.columns = columns
+    series.encoded = {}
+    return series
@@ -0,0 +1,76 @@
+from heapq import heappush, heappushpop
+from math import radians, cos, sin, asin, sqrt
+
+EARTH_RADIUS_KM = 6371
+
+
+def to_unit_vector(lat, lon):
+    """Converts decimal degrees into a point on the unit sphere"""
+    lat, lon = radians(float(lat)), radians(float(lon))
+    return (cos(lat) * cos(lon), cos(lat) * sin(lon), sin(lat))
+
+
+def chord_to_km(chord: float) -> float:
+    """Converts a straight line distance through the unit sphere into a great circle distance"""
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, chord / 2))
+
+
+class SpatialIndex:
+    """
+    KD-tree over a list of dicts with lat / lon keys, built once and then
+    queried for the nearest items. Points are stored as 3D unit vectors so
+    there are no edge cases at the poles or the antimeridian, and the
+    straight line (chord) ordering is the same as the great circle ordering.
+    The indexed items are never modified.
+    """
+
+    def __init__(self, items, lat_key='latitude', lon_key='longitude'):
+        self.items = list(items)
+        self._points = [to_unit_vector(item[lat_key], item[lon_key])
+                        for item in self.items]
+        self._tree = self._build(list(range(len(self.items))), 0)
+
+    def __len__(self):
+        return len(self.items)
+
+    def _build(self, indices, depth):
+        if not indices:
+            return None
+        axis = depth % 3
+        indices.sort(key=lambda i: self._points[i][axis])
+        middle = len(indices) // 2
+        return (indices[middle], axis,
+                self._build(indices[:middle], depth + 1),
+                self._build(indices[middle + 1:], depth + 1))
+
+    def _search(self, node, target, k, heap):
+        if node is None:
+            return
+        index, axis, left, right = node
+        point = self._points[index]
+        dist_squared = ((target[0] - point[0]) ** 2 + (target[1] - point[1]) ** 2 +
+                        (target[2] - point[2]) ** 2)
+        # heap holds the k closest so far as a max heap on distance
+        if len(heap) < k:
+            heappush(heap, (-dist_squared, index))
+        elif dist_squared < -heap[0][0]:
+            heappushpop(heap, (-dist_squared, index))
+
+        diff = target[axis] - point[axis]
+        near, far = (left, right) if diff < 0 else (right, left)
+        self._search(near, target, k, heap)
+        if len(heap) < k or diff * diff < -heap[0][0]:
+            self._search(far, target, k, heap)
+
+    def k_nearest(self, lat, lon, k=1):
+        """Returns a list of (item, distance_km) for the k closest items, closest first"""
+        heap = []
+        self._search(self._tree, to_unit_vector(lat, lon), k, heap)
+        return [(self.items[index], chord_to_km(sqrt(-neg_dist_squared)))
+                for neg_dist_squared, index in sorted(heap, reverse=True)]
+
+    def nearest(self, lat, lon):
+        """Returns (item, distance_km) for the closest item"""
+        if not self.items:
+            raise ValueError("Can't query an empty spatial index")
+        return self.k_nearest(lat, lon, 1)[0]
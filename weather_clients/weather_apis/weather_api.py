@@ -1,57 +1,51 @@
 from datetime import datetime
-from json import loads
 import requests
 from os import getenv
 
-from tornado.httpclient import AsyncHTTPClient
 from tornado.httputil import url_concat
 
 from .base import WeatherDataClient
-from .utils.definitions import open_weather_visibility_lookup, uv_lookup_codes
+from .utils.forecast_series import ForecastSeries
 
 # weatherapi.com
 WEATHER_API_KEY = getenv("WEATHER_API_KEY")
 
 
 class WeatherApiClient(WeatherDataClient):
+    cache_ttl = 900
+    visibility_unit = 'km'
+
     def __init__(self):
         self.base_url = f"http://api.weatherapi.com/v1/"
 
     async def get_forecast_lat_lon(self, lat, lon):
         endpoint = "forecast.json"
-        http_client = AsyncHTTPClient()
-
-        response = await http_client.fetch(url_concat(self.base_url + endpoint,
+        response = await self.fetch(url_concat(self.base_url + endpoint,
                                                       {'key': WEATHER_API_KEY,
                                                        'q': f"{lat},{lon}", 'days': 5, 'aqi': 'no', 'alerts': 'no'}))
-        return loads(response.body)
+        return await self.parse(response.body)
 
     def process_data(self, data: any):
-        processed_weather_data = []
         lat = data['location']['lat']
         lon = data['location']['lon']
         place_name = data['location']['name'] + \
             data['location']['region'] + data['location']['country']
+        processed_weather_data = ForecastSeries(lat, lon, place_name)
         for day in data['forecast']['forecastday']:
             for hourly in day['hour']:
-                processed_data = {
-                    'lat': lat,
-                    'lon': lon,
-                    'place_name': place_name,
-                    'date_time': datetime.fromtimestamp(hourly['time_epoch']),
-                    'temperature_celcius': float(hourly['temp_c']),
-                    'feels_like_temperature_celcius': float(hourly['feelslike_c']),
-                    'wind_speed_kph': float(hourly['wind_kph']),
-                    'wind_direction': hourly['wind_dir'],
-                    'wind_gust_kph': float(hourly['gust_kph']),
-                    'relative_humidity_percentage': float(hourly['humidity']),
-                    'visibility': open_weather_visibility_lookup(hourly['vis_km'] * 1000),
-                    'uv_index': {'code': hourly['uv'], 'description': uv_lookup_codes[str(int(hourly['uv']))]},
-                    'weather_type': hourly['condition']['text'],
-                    'precipitation_probability_percentage': hourly['chance_of_rain'],
-                }
-                processed_weather_data.append(processed_data)
-        return processed_weather_data
+                processed_weather_data.append(
+                    date_time=datetime.fromtimestamp(hourly['time_epoch']),
+                    temperature_celcius=float(hourly['temp_c']),
+                    feels_like_temperature_celcius=float(hourly['feelslike_c']),
+                    wind_speed=float(hourly['wind_kph']),
+                    wind_direction=hourly['wind_dir'],
+                    wind_gust=float(hourly['gust_kph']),
+                    relative_humidity_percentage=float(hourly['humidity']),
+                    visibility_distance=float(hourly['vis_km']),
+                    uv_index=hourly['uv'],
+                    weather_type=hourly['condition']['text'],
+                    precipitation_probability_percentage=hourly['chance_of_rain'])
+        return self.normalise(processed_weather_data)
 
 
 # weather_api = WeatherApiClient()
@@ -1,54 +1,58 @@
 from datetime import datetime
-from json import loads
 import requests
 from os import getenv
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-from tornado.httpclient import AsyncHTTPClient
 from tornado.httputil import url_concat
 
 from .base import WeatherDataClient
-from .utils.definitions import weatherbit_wind_direction_lookup, open_weather_visibility_lookup, uv_lookup_codes, weatherbit_weather_code_lookup
+from .utils.definitions import weatherbit_wind_direction_lookup, weatherbit_weather_code_lookup
+from .utils.forecast_series import ForecastSeries
 
 # Weatherbit.io
 WEATHERBIT_IO_API_KEY = getenv("WEATHERBIT_IO_API_KEY")
 
 
 class WeatherbitIoClient(WeatherDataClient):
+    cache_ttl = 1800
+    daily_quota = 50
+    speed_unit = 'ms'
+    visibility_unit = 'km'
+
     def __init__(self):
         self.base_url = "http://api.weatherbit.io/v2.0/forecast/hourly"
         self.endpoint = F"?lang=en&key={WEATHERBIT_IO_API_KEY}"
 
     async def get_forecast_lat_lon(self, lat, lon):
-        http_client = AsyncHTTPClient()
-        response = await http_client.fetch(
+        response = await self.fetch(
             url_concat(self.base_url + self.endpoint, {'lat': lat, 'lon': lon})
         )
-        return self.process_data(loads(response.body))
+        return await self.parse(response.body)
 
     def process_data(self, data: any):
-        processed_weather_data = []
         lat = data['lat']
         lon = data['lon']
         place_name = data['city_name']
+        try:
+            # timestamp_local is local to the forecast location
+            local_tz = ZoneInfo(data['timezone'])
+        except (KeyError, ValueError, ZoneInfoNotFoundError):
+            local_tz = None
+        processed_weather_data = ForecastSeries(lat, lon, place_name, naive_tz=local_tz)
         for hourly in data['data']:
-            processed_data = {
-                'lat': lat,
-                'lon': lon,
-                'place_name': place_name,
-                'date_time': datetime.fromisoformat(hourly['timestamp_local']),
-                'temperature_celcius': float(hourly['temp']),
-                'feels_like_temperature_celcius': float(hourly['app_temp']),
-                'wind_speed_kph': float(hourly['wind_spd']),
-                'wind_direction': weatherbit_wind_direction_lookup[hourly['wind_cdir_full']],
-                'wind_gust_mph': float(hourly['wind_gust_spd']),
-                'relative_humidity_percentage': None,
-                'visibility': open_weather_visibility_lookup(hourly['vis'] * 1000),
-                'uv_index': {'code': hourly['uv'], 'description': uv_lookup_codes[str(int(hourly['uv']))]},
-                'weather_type': weatherbit_weather_code_lookup[str(hourly['weather']['code'])],
-                'precipitation_probability_percentage': hourly['pop'],
-            }
-            processed_weather_data.append(processed_data)
-        return processed_weather_data
+            processed_weather_data.append(
+                date_time=datetime.fromisoformat(hourly['timestamp_local']),
+                temperature_celcius=float(hourly['temp']),
+                feels_like_temperature_celcius=float(hourly['app_temp']),
+                wind_speed=float(hourly['wind_spd']),
+                wind_direction=weatherbit_wind_direction_lookup[hourly['wind_cdir_full']],
+                wind_gust=float(hourly['wind_gust_spd']),
+                relative_humidity_percentage=None,
+                visibility_distance=float(hourly['vis']),
+                uv_index=hourly['uv'],
+                weather_type=weatherbit_weather_code_lookup[str(hourly['weather']['code'])],
+                precipitation_probability_percentage=hourly['pop'])
+        return self.normalise(processed_weather_data)
 
 
 # weatherbit_io = WeatherbitIoClient()